@@ -0,0 +1,169 @@
+"""
+_cache.py - Two-tier (in-memory LRU + SQLite) cache for Gemini responses in HeritageAI.
+"""
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple, Union
+
+try:
+    from blake3 import blake3
+except ImportError:
+    blake3 = None
+
+logger = logging.getLogger(__name__)
+
+# Values are stored as-is; SQLite keeps bytes as BLOBs even in a TEXT column
+CacheValue = Union[str, bytes]
+
+# Read size used when hashing files
+_HASH_CHUNK_SIZE = 1 << 20
+
+# Directory holding the on-disk cache databases
+CACHE_DIR = os.getenv('HERITAGE_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache'))
+
+class SqliteCache:
+    """Key/value cache with an in-memory LRU in front of a SQLite table."""
+
+    def __init__(self, name: str, memory_size: int = 1024, ttl: Optional[int] = None) -> None:
+        """
+        Open (or create) the cache database.
+        Args:
+            name (str): Database file name inside CACHE_DIR.
+            memory_size (int): Maximum number of entries kept in the in-memory LRU.
+            ttl (Optional[int]): Seconds an entry stays valid; None keeps entries forever.
+        """
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        self.path = os.path.join(CACHE_DIR, name)
+        self.memory_size = memory_size
+        self.ttl = ttl
+        self._memory: "OrderedDict[str, Tuple[CacheValue, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT, created_at INTEGER)")
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(cache)")}
+        if 'created_at' not in columns:
+            # Databases created before TTL support; existing rows count as fresh
+            self._conn.execute("ALTER TABLE cache ADD COLUMN created_at INTEGER")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[CacheValue]:
+        """Return the cached value for key, or None on a miss or expired entry."""
+        with self._lock:
+            if key in self._memory:
+                value, created_at = self._memory[key]
+                if not self._expired(created_at):
+                    self._memory.move_to_end(key)
+                    return value
+                del self._memory[key]
+            try:
+                row = self._conn.execute("SELECT value, created_at FROM cache WHERE key = ?", (key,)).fetchone()
+            except sqlite3.Error as e:
+                logger.warning(f"Cache read failed for {self.path}: {e}")
+                return None
+            if row is None or self._expired(row[1]):
+                return None
+            self._remember(key, row[0], row[1])
+            return row[0]
+
+    def set(self, key: str, value: CacheValue) -> None:
+        """Store value under key in both tiers."""
+        created_at = int(time.time())
+        with self._lock:
+            self._remember(key, value, created_at)
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO cache (key, value, created_at) VALUES (?, ?, ?)",
+                    (key, value, created_at)
+                )
+                self._conn.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Cache write failed for {self.path}: {e}")
+
+    def delete(self, key: str) -> None:
+        """Remove key from both tiers."""
+        with self._lock:
+            self._memory.pop(key, None)
+            try:
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self._conn.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Cache delete failed for {self.path}: {e}")
+
+    def purge_expired(self) -> int:
+        """Delete entries older than the TTL from disk and return how many were removed."""
+        if self.ttl is None:
+            return 0
+        with self._lock:
+            try:
+                cursor = self._conn.execute("DELETE FROM cache WHERE created_at < ?", (int(time.time()) - self.ttl,))
+                self._conn.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Cache purge failed for {self.path}: {e}")
+                return 0
+        return cursor.rowcount
+
+    def close(self) -> None:
+        """Close the database connection; later reads miss and writes are dropped with a warning."""
+        with self._lock:
+            self._memory.clear()
+            self._conn.close()
+
+    def _expired(self, created_at: Optional[int]) -> bool:
+        """True if an entry written at created_at is older than the TTL."""
+        return self.ttl is not None and created_at is not None and time.time() - created_at > self.ttl
+
+    def _remember(self, key: str, value: CacheValue, created_at: Optional[int]) -> None:
+        """Insert into the in-memory LRU, evicting the oldest entry when full."""
+        self._memory[key] = (value, created_at)
+        self._memory.move_to_end(key)
+        if len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+class FailureCache:
+    """Remembers recent failures per key for a short window, so callers can fail fast instead of retrying."""
+
+    def __init__(self, ttl: float = 60) -> None:
+        """
+        Args:
+            ttl (float): Seconds a recorded failure stays fresh.
+        """
+        self.ttl = ttl
+        self._failed_at: dict = {}
+
+    def recently_failed(self, key: str) -> bool:
+        """True if key failed less than ttl seconds ago."""
+        failed_at = self._failed_at.get(key)
+        if failed_at is None:
+            return False
+        if time.monotonic() - failed_at > self.ttl:
+            self._failed_at.pop(key, None)
+            return False
+        return True
+
+    def record(self, key: str) -> None:
+        """Mark key as having just failed."""
+        self._failed_at[key] = time.monotonic()
+
+    def clear(self, key: str) -> None:
+        """Forget a failure for key after a success."""
+        self._failed_at.pop(key, None)
+
+def file_digest(path: str) -> str:
+    """
+    Return a hex digest of a file's contents, streamed in 1 MiB chunks.
+    Uses BLAKE3 when the blake3 package is installed, otherwise BLAKE2b.
+    """
+    hasher = blake3() if blake3 is not None else hashlib.blake2b(digest_size=32)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+def text_digest(text: str) -> str:
+    """Return a short BLAKE2b hex digest of a text string."""
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=8).hexdigest()
@@ -4,76 +4,178 @@ ai_culture_generator.py - AI-powered generation of culture-specific design eleme
 import json
 import re
 import os
+import asyncio
 import logging
-from typing import List, Dict, Any, Optional
-from gemini_client import gemini_client
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, TypeVar
+from gemini_client import AsyncGeminiClient, GeminiClient, get_client
 from color_palette import extract_palette
+import json_utils
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+# Bound on in-flight Gemini image-analysis calls shared by every metadata job in the process.
+# A threading semaphore is used because the calls run in worker threads and each sync
+# generate_culture_metadata call spins up its own event loop.
+GEMINI_MAX_CONCURRENCY = int(os.getenv('GEMINI_MAX_CONCURRENCY', 8))
+_gemini_semaphore = threading.BoundedSemaphore(GEMINI_MAX_CONCURRENCY)
+
+# Fused fonts/elements/patterns/brief prompt; only culture and style vary per call
+CULTURE_ANALYSIS_PROMPT_TMPL = """
+Analyze this {culture} cultural design image and return ONE JSON object with exactly these keys:
+"fonts", "elements", "patterns", "brief".
+
+"fonts": a JSON array of 4-6 font names that would complement the visual style, like
+["Font Name 1", "Font Name 2", "Font Name 3"]. Consider:
+- The overall aesthetic and mood of the design
+- Cultural authenticity and respect
+- Readability and modern usability
+- Font availability on common platforms
+
+"elements": a JSON array of 3-5 key design elements present in the image. For each element provide:
+- type: "symbol", "pattern", "motif", "shape", "texture", or "element"
+- name: A descriptive name for what you see
+- description: Brief explanation of what the element is and its visual characteristics
+
+"patterns": a JSON array describing each pattern visible in the image. For each pattern provide:
+- name: Pattern name based on what you see
+- description: Detailed description of the pattern's visual characteristics
+- style: Visual style (geometric, organic, abstract, etc.)
+- usage: How this pattern appears to be used in the design
+
+"brief": a JSON object forming a comprehensive design brief with these fields:
+- cultural_context: What cultural elements or style you observe
+- design_principles: Key design principles evident in this image
+- color_philosophy: How colors are used and their visual impact
+- typography_approach: What typography would complement this style
+- pattern_usage: How patterns are used in this design
+- modern_adaptation: How this style could be adapted to {style} design
+- cultural_sensitivity: Guidelines for respectful use of this style
+
+Return ONLY the JSON object, shaped like:
+{{
+    "fonts": ["Font Name 1", "Font Name 2"],
+    "elements": [{{"type": "symbol", "name": "Element Name", "description": "Description of what you see"}}],
+    "patterns": [{{"name": "Pattern Name", "description": "Detailed description", "style": "geometric", "usage": "How it's used"}}],
+    "brief": {{"cultural_context": "...", "design_principles": "..."}}
+}}
+
+Focus on what you actually see in the image, not general cultural knowledge.
+"""
+
+# Greedy fallbacks for responses the brace scanner cannot parse
+_JSON_ARRAY_RE = re.compile(r'\[.*\]', re.DOTALL)
+_JSON_OBJECT_RE = re.compile(r'\{.*\}', re.DOTALL)
+
+def _find_json(text: str, open_char: str, close_char: str, start: int) -> Optional[str]:
+    """Return the balanced open_char...close_char slice of text beginning at start, skipping brackets inside strings."""
+    depth, in_string, escaped = 0, False, False
+    for i in range(start, len(text)):
+        c = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif c == '\\':
+                escaped = True
+            elif c == '"':
+                in_string = False
+        elif c == '"':
+            in_string = True
+        elif c == open_char:
+            depth += 1
+        elif c == close_char:
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    return None
+
+def _parse_json_span(text: str, open_char: str, close_char: str, fallback: "re.Pattern[str]") -> Any:
+    """Parse the first JSON value delimited by open_char/close_char in text, or return None."""
+    start = text.find(open_char)
+    while start >= 0:
+        span = _find_json(text, open_char, close_char, start)
+        if span is None:
+            break
+        try:
+            return json_utils.loads(span)
+        except json.JSONDecodeError:
+            start = text.find(open_char, start + 1)
+    match = fallback.search(text)
+    if match:
+        try:
+            return json_utils.loads(match.group())
+        except json.JSONDecodeError:
+            return None
+    return None
+
+def _call_limited(func: Callable[..., T], *args: Any) -> T:
+    """Run a blocking Gemini-backed call while holding the shared concurrency slot."""
+    with _gemini_semaphore:
+        return func(*args)
+
 class AICultureGenerator:
     """Generate culture-specific design elements using AI image analysis."""
     
     def __init__(self) -> None:
-        """Initialize the AICultureGenerator with a Gemini client."""
-        self.gemini_client = gemini_client
+        """Initialize the AICultureGenerator; the Gemini client is created on first use."""
     
-    def generate_culture_fonts(self, culture: str, image_path: str) -> List[str]:
-        """Generate a list of culture-specific fonts by analyzing the image."""
-        prompt = f"""
-        Analyze this {culture} cultural design image and identify 4-6 appropriate fonts that would complement the visual style.
-        
-        Consider:
-        - The overall aesthetic and mood of the design
-        - Cultural authenticity and respect
-        - Readability and modern usability
-        - Font availability on common platforms
-        
-        Return ONLY a JSON array of font names, like:
-        ["Font Name 1", "Font Name 2", "Font Name 3"]
-        
-        Focus on fonts that would work well with this specific design style.
-        """
+    @property
+    def gemini_client(self) -> GeminiClient:
+        """Shared Gemini client."""
+        return get_client()
+    
+    def _request_combined_analysis(self, culture: str, image_path: str, style: str) -> Optional[Dict[str, Any]]:
+        """Send the fused fonts/elements/patterns/brief prompt and parse the JSON object reply."""
+        prompt = CULTURE_ANALYSIS_PROMPT_TMPL.format(culture=culture, style=style)
         try:
             response = self.gemini_client.analyze_image_with_prompt(image_path, prompt)
-            if response:
-                fonts = self._extract_json_array(response)
-                return fonts if fonts else self._get_fallback_fonts(culture)
-            return self._get_fallback_fonts(culture)
+            return self._extract_json_object(response) if response else None
         except Exception as e:
-            logger.error(f"Error generating fonts for {culture}: {e}")
-            return self._get_fallback_fonts(culture)
+            logger.error(f"Error analyzing image for {culture}: {e}")
+            return None
     
-    def generate_culture_elements(self, culture: str, image_path: str) -> List[Dict[str, str]]:
-        """Generate a list of culture-specific design elements by analyzing the image."""
-        prompt = f"""
-        Analyze this {culture} cultural design image and identify 3-5 key design elements present.
-        
-        For each element you see, provide:
-        - type: "symbol", "pattern", "motif", "shape", "texture", or "element"
-        - name: A descriptive name for what you see
-        - description: Brief explanation of what the element is and its visual characteristics
-        
-        Return ONLY a JSON array like:
-        [
-            {{"type": "symbol", "name": "Element Name", "description": "Description of what you see"}},
-            {{"type": "pattern", "name": "Pattern Name", "description": "Description of the pattern"}}
-        ]
-        
-        Focus on actual elements visible in the image, not general cultural knowledge.
-        """
+    async def _request_combined_analysis_async(
+        self, client: AsyncGeminiClient, culture: str, image_path: str, style: str
+    ) -> Optional[Dict[str, Any]]:
+        """Async version of _request_combined_analysis, awaited on an open AsyncGeminiClient."""
+        prompt = CULTURE_ANALYSIS_PROMPT_TMPL.format(culture=culture, style=style)
         try:
-            response = self.gemini_client.analyze_image_with_prompt(image_path, prompt)
-            if response:
-                elements = self._extract_json_array(response)
-                return elements if elements else self._get_fallback_elements(culture)
-            return self._get_fallback_elements(culture)
+            response = await client.analyze_image_with_prompt(image_path, prompt)
+            return self._extract_json_object(response) if response else None
         except Exception as e:
-            logger.error(f"Error generating elements for {culture}: {e}")
-            return self._get_fallback_elements(culture)
+            logger.error(f"Error analyzing image for {culture}: {e}")
+            return None
+    
+    def generate_culture_everything(self, culture: str, image_path: str, style: str = "modern") -> Dict[str, Any]:
+        """Analyze the image once and return fonts, elements, patterns, and brief together."""
+        return self._everything_from_analysis(culture, style, self._request_combined_analysis(culture, image_path, style) or {})
+    
+    def _everything_from_analysis(self, culture: str, style: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Pick fonts, elements, patterns, and brief out of a parsed analysis, falling back per field."""
+        fonts = data.get("fonts")
+        elements = data.get("elements")
+        patterns = data.get("patterns")
+        brief = data.get("brief")
+        return {
+            "fonts": fonts if isinstance(fonts, list) and fonts else self._get_fallback_fonts(culture),
+            "elements": elements if isinstance(elements, list) and elements else self._get_fallback_elements(culture),
+            "patterns": patterns if isinstance(patterns, list) and patterns else self._get_fallback_patterns(culture),
+            "brief": brief if isinstance(brief, dict) and brief else self._get_fallback_brief(culture, style)
+        }
+    
+    def generate_culture_fonts(self, culture: str, image_path: str) -> List[str]:
+        """Generate a list of culture-specific fonts by analyzing the image."""
+        return self.generate_culture_everything(culture, image_path)["fonts"]
+    
+    def generate_culture_elements(self, culture: str, image_path: str) -> List[Dict[str, str]]:
+        """Generate a list of culture-specific design elements by analyzing the image."""
+        return self.generate_culture_everything(culture, image_path)["elements"]
     
     def generate_culture_colors(self, culture: str, image_path: str) -> List[str]:
-        """Extract a color palette from the image using ColorThief."""
+        """Extract a color palette from the image using k-means clustering."""
         try:
             colors, _ = extract_palette(image_path, palette_size=8)
             return colors
@@ -83,99 +185,93 @@ class AICultureGenerator:
     
     def generate_culture_patterns(self, culture: str, image_path: str) -> List[Dict[str, str]]:
         """Generate pattern descriptions by analyzing the image."""
-        prompt = f"""
-        Analyze this {culture} cultural design image and describe the patterns you see.
-        
-        For each pattern visible in the image, provide:
-        - name: Pattern name based on what you see
-        - description: Detailed description of the pattern's visual characteristics
-        - style: Visual style (geometric, organic, abstract, etc.)
-        - usage: How this pattern appears to be used in the design
-        
-        Return ONLY a JSON array like:
-        [
-            {{
-                "name": "Pattern Name",
-                "description": "Detailed description of what you see",
-                "style": "geometric",
-                "usage": "How it's used in the design"
-            }}
-        ]
-        
-        Focus on actual patterns visible in the image, not general cultural patterns.
-        """
-        try:
-            response = self.gemini_client.analyze_image_with_prompt(image_path, prompt)
-            if response:
-                patterns = self._extract_json_array(response)
-                return patterns if patterns else self._get_fallback_patterns(culture)
-            return self._get_fallback_patterns(culture)
-        except Exception as e:
-            logger.error(f"Error generating patterns for {culture}: {e}")
-            return self._get_fallback_patterns(culture)
+        return self.generate_culture_everything(culture, image_path)["patterns"]
     
     def generate_culture_brief(self, culture: str, image_path: str, style: str = "modern") -> Dict[str, str]:
         """Generate a comprehensive design brief by analyzing the image."""
-        prompt = f"""
-        Analyze this {culture} cultural design image and create a comprehensive design brief.
-        
-        Based on what you see in the image, provide:
-        - cultural_context: What cultural elements or style you observe
-        - design_principles: Key design principles evident in this image
-        - color_philosophy: How colors are used and their visual impact
-        - typography_approach: What typography would complement this style
-        - pattern_usage: How patterns are used in this design
-        - modern_adaptation: How this style could be adapted to {style} design
-        - cultural_sensitivity: Guidelines for respectful use of this style
-        
-        Return ONLY a JSON object with these fields.
-        Focus on what you actually see in the image, not general cultural knowledge.
-        """
-        try:
-            response = self.gemini_client.analyze_image_with_prompt(image_path, prompt)
-            if response:
-                brief = self._extract_json_object(response)
-                return brief if brief else self._get_fallback_brief(culture, style)
-            return self._get_fallback_brief(culture, style)
-        except Exception as e:
-            logger.error(f"Error generating brief for {culture}: {e}")
-            return self._get_fallback_brief(culture, style)
+        return self.generate_culture_everything(culture, image_path, style)["brief"]
     
+    async def generate_culture_everything_async(
+        self, culture: str, image_path: str, style: str = "modern", client: Optional[AsyncGeminiClient] = None
+    ) -> Dict[str, Any]:
+        """
+        Async version of generate_culture_everything.
+        With an open AsyncGeminiClient the analysis is awaited natively; otherwise the sync
+        call runs in a worker thread.
+        """
+        if client is None:
+            return await asyncio.to_thread(_call_limited, self.generate_culture_everything, culture, image_path, style)
+        data = await self._request_combined_analysis_async(client, culture, image_path, style)
+        return self._everything_from_analysis(culture, style, data or {})
+
+    async def generate_culture_fonts_async(self, culture: str, image_path: str) -> List[str]:
+        """Async wrapper around generate_culture_fonts."""
+        return (await self.generate_culture_everything_async(culture, image_path))["fonts"]
+
+    async def generate_culture_elements_async(self, culture: str, image_path: str) -> List[Dict[str, str]]:
+        """Async wrapper around generate_culture_elements."""
+        return (await self.generate_culture_everything_async(culture, image_path))["elements"]
+
+    async def generate_culture_patterns_async(self, culture: str, image_path: str) -> List[Dict[str, str]]:
+        """Async wrapper around generate_culture_patterns."""
+        return (await self.generate_culture_everything_async(culture, image_path))["patterns"]
+
+    async def generate_culture_brief_async(self, culture: str, image_path: str, style: str = "modern") -> Dict[str, str]:
+        """Async wrapper around generate_culture_brief."""
+        return (await self.generate_culture_everything_async(culture, image_path, style))["brief"]
+
+    async def generate_culture_metadata_async(
+        self, culture: str, image_path: str, client: Optional[AsyncGeminiClient] = None
+    ) -> Dict[str, Any]:
+        """
+        Generate culture metadata, running the single Gemini analysis and palette extraction concurrently.
+        Pass an open AsyncGeminiClient to await the analysis on it instead of a worker thread.
+        """
+        if not os.path.exists(image_path):
+            raise FileNotFoundError(f"Image not found: {image_path}")
+        analysis, colors = await asyncio.gather(
+            self.generate_culture_everything_async(culture, image_path, client=client),
+            asyncio.to_thread(self.generate_culture_colors, culture, image_path)
+        )
+        return self._metadata(culture, image_path, analysis, colors)
+
     def generate_culture_metadata(self, culture: str, image_path: str) -> Dict[str, Any]:
-        """Generate comprehensive culture metadata by analyzing the image."""
+        """
+        Generate comprehensive culture metadata by analyzing the image.
+        Fully synchronous (usable from inside a running event loop); the palette is extracted on
+        a worker thread while the Gemini analysis runs.
+        """
         if not os.path.exists(image_path):
             raise FileNotFoundError(f"Image not found: {image_path}")
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            colors_future = pool.submit(self.generate_culture_colors, culture, image_path)
+            analysis = _call_limited(self.generate_culture_everything, culture, image_path)
+            colors = colors_future.result()
+        return self._metadata(culture, image_path, analysis, colors)
+
+    def _metadata(self, culture: str, image_path: str, analysis: Dict[str, Any], colors: List[str]) -> Dict[str, Any]:
+        """Assemble the metadata record from the combined analysis and the extracted palette."""
         return {
             "culture": culture,
             "source_image": image_path,
-            "fonts": self.generate_culture_fonts(culture, image_path),
-            "elements": self.generate_culture_elements(culture, image_path),
-            "colors": self.generate_culture_colors(culture, image_path),
-            "patterns": self.generate_culture_patterns(culture, image_path),
-            "brief": self.generate_culture_brief(culture, image_path),
+            "fonts": analysis["fonts"],
+            "elements": analysis["elements"],
+            "colors": colors,
+            "patterns": analysis["patterns"],
+            "brief": analysis["brief"],
             "generated_by": "AI Image Analysis",
             "version": "2.0"
         }
-    
+
     def _extract_json_array(self, text: str) -> Optional[List[Any]]:
         """Extract a JSON array from AI response text."""
-        try:
-            match = re.search(r'\[.*\]', text, re.DOTALL)
-            if match:
-                return json.loads(match.group())
-            return None
-        except json.JSONDecodeError:
-            return None
+        result = _parse_json_span(text, '[', ']', _JSON_ARRAY_RE)
+        return result if isinstance(result, list) else None
     
     def _extract_json_object(self, text: str) -> Optional[Dict[str, Any]]:
         """Extract a JSON object from AI response text."""
-        try:
-            match = re.search(r'\{.*\}', text, re.DOTALL)
-            if match:
-                return json.loads(match.group())
-            return None
-        except json.JSONDecodeError:
-            return None
+        result = _parse_json_span(text, '{', '}', _JSON_OBJECT_RE)
+        return result if isinstance(result, dict) else None
     
     def _get_fallback_fonts(self, culture: str) -> List[str]:
         """Return fallback fonts if AI generation fails."""
@@ -2,12 +2,19 @@
 clip_model.py - CLIP-based pattern scoring and (dummy) pattern/palette generation for HeritageAI.
 """
 import os
-import json
-import torch
-import open_clip
 import logging
-from typing import Tuple, Dict
-from PIL import Image
+import threading
+import contextlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Tuple, Dict, List, Optional
+import json_utils
+from _cache import CACHE_DIR, file_digest
+
+# torch, open_clip, torchvision and PIL are imported lazily so that importing this module stays cheap
+if TYPE_CHECKING:
+    import numpy as np
+    import torch
 
 logger = logging.getLogger(__name__)
 
@@ -33,29 +40,320 @@ def generate_pattern_and_palette(culture: str) -> Tuple[str, str]:
         'accent': '#fedcba',
         'note': f'Dummy palette for {culture}'
     }
-    with open(palette_path, 'w') as f:
-        json.dump(palette, f, indent=2)
+    json_utils.dump(palette, palette_path)
     return pattern_path, palette_path
 
-# Cache model and preprocess globally
-_clip_model = None
-_clip_preprocess = None
-_clip_device = "cuda" if torch.cuda.is_available() else "cpu"
+_CLIP_MODEL_NAME = "ViT-B-32-quickgelu"
+_CLIP_PRETRAINED = "openai"
+# Image embedding store for this model, keyed by image content digest
+_EMB_STORE_PATH = os.path.join(CACHE_DIR, 'clip', f"{_CLIP_MODEL_NAME}-{_CLIP_PRETRAINED}-embeddings.npz")
+# Plain state_dict copy of the pretrained weights, memory-mapped on later loads
+_WEIGHTS_PATH = os.path.join(CACHE_DIR, 'clip', f"{_CLIP_MODEL_NAME}-{_CLIP_PRETRAINED}.pt")
+
+# Cache model, preprocess and device settings globally; populated by _load_clip
+_clip_model: Any = None
+_clip_preprocess: Any = None
+_clip_device: Optional[str] = None
+_clip_dtype: Any = None
+# Tensor equivalent of open_clip's PIL preprocessing, applied on _clip_device to uint8 images
+_clip_transform: Any = None
+# Normalized text embeddings for the most recent prompts (LRU), so the text tower runs once per prompt
+_TEXT_FEATURES_CACHE_SIZE = 256
+_text_features_cache: "OrderedDict[str, torch.Tensor]" = OrderedDict()
+# Guards the one-time load when several threads score at once
+_clip_lock = threading.Lock()
+
+def _create_clip_model(device: str) -> Tuple[Any, Any]:
+    """
+    Build the CLIP model and its preprocessing transform.
+    The first load pulls the pretrained checkpoint and saves its state_dict to _WEIGHTS_PATH;
+    later loads build the bare architecture and memory-map those weights instead of
+    unpickling the original checkpoint.
+    """
+    import torch
+    import open_clip
+    if os.path.exists(_WEIGHTS_PATH):
+        try:
+            model, _, preprocess = open_clip.create_model_and_transforms(_CLIP_MODEL_NAME, pretrained=None)
+            state_dict = torch.load(_WEIGHTS_PATH, map_location="cpu", mmap=True, weights_only=True)
+            model.load_state_dict(state_dict, assign=True)
+            return model.to(device), preprocess
+        except Exception as e:
+            logger.warning(f"Could not load cached CLIP weights from {_WEIGHTS_PATH}, reloading checkpoint: {e}")
+    model, _, preprocess = open_clip.create_model_and_transforms(
+        _CLIP_MODEL_NAME, pretrained=_CLIP_PRETRAINED, device=device
+    )
+    tmp_path = f"{_WEIGHTS_PATH}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(_WEIGHTS_PATH), exist_ok=True)
+        torch.save(model.state_dict(), tmp_path)
+        os.replace(tmp_path, _WEIGHTS_PATH)
+    except OSError as e:
+        logger.warning(f"Could not cache CLIP weights at {_WEIGHTS_PATH}: {e}")
+    return model, preprocess
+
+def get_clip() -> Tuple[Any, Any, str]:
+    """
+    Return the process-wide CLIP model, its preprocessing transform and device, loading them on first use.
+    Returns:
+        Tuple[Any, Any, str]: (model, preprocess, device).
+    """
+    _load_clip()
+    return _clip_model, _clip_preprocess, _clip_device
 
 def _load_clip() -> None:
     """
     Load the CLIP model and preprocessing transforms if not already loaded.
+    On CUDA the weights are cast to FP16 and the encoders compiled with torch.compile.
     """
-    global _clip_model, _clip_preprocess
+    if _clip_model is not None and _clip_preprocess is not None:
+        return
+    with _clip_lock:
+        _load_clip_locked()
+
+def _load_clip_locked() -> None:
+    global _clip_model, _clip_preprocess, _clip_device, _clip_dtype, _clip_transform
     if _clip_model is None or _clip_preprocess is None:
-        _clip_model, _, _clip_preprocess = open_clip.create_model_and_transforms(
-            "ViT-B-32-quickgelu", pretrained="openai", device=_clip_device
-        )
-        _clip_model.eval()
-        logger.info(f"Loaded CLIP model on device: {_clip_device}")
+        import torch
+        import open_clip
+        from torchvision.transforms import v2
+        _clip_device = "cuda" if torch.cuda.is_available() else "cpu"
+        if _clip_device == "cpu":
+            torch.set_num_threads(int(os.getenv('CLIP_NUM_THREADS', os.cpu_count() or 1)))
+        # Half precision only pays off on GPU; CPU kernels for FP16 are slow or missing
+        _clip_dtype = torch.float16 if _clip_device == "cuda" else torch.float32
+        _clip_transform = v2.Compose([
+            v2.Resize(224, interpolation=v2.InterpolationMode.BICUBIC, antialias=True),
+            v2.CenterCrop(224),
+            v2.ToDtype(_clip_dtype, scale=True),
+            v2.Normalize(mean=open_clip.OPENAI_DATASET_MEAN, std=open_clip.OPENAI_DATASET_STD)
+        ])
+        model, preprocess = _create_clip_model(_clip_device)
+        model.eval()
+        if _clip_device == "cuda":
+            model = model.to(device=_clip_device, dtype=_clip_dtype)
+            try:
+                model.encode_image = torch.compile(model.encode_image, mode="reduce-overhead")
+                model.encode_text = torch.compile(model.encode_text, mode="reduce-overhead")
+            except Exception as e:
+                logger.warning(f"torch.compile unavailable, running CLIP eagerly: {e}")
+        # Published last, so the unlocked fast path in _load_clip never sees a half-built model
+        _clip_preprocess = preprocess
+        _clip_model = model
+        logger.info(f"Loaded CLIP model on device: {_clip_device} ({_clip_dtype})")
+
+def _get_text_features(prompts: List[str]) -> "torch.Tensor":
+    """
+    Return stacked normalized CLIP text embeddings for prompts, encoding uncached ones in one batch.
+    Must be called with the model loaded and inside an inference context.
+    """
+    import torch
+    import open_clip
+    missing = [p for p in dict.fromkeys(prompts) if p not in _text_features_cache]
+    if missing:
+        text_input = open_clip.tokenize(missing).to(_clip_device)
+        text_features = _clip_model.encode_text(text_input)
+        # Out of place and cloned: under CUDA graphs the encoder's output buffer is reused by the next call
+        text_features = (text_features / text_features.norm(dim=-1, keepdim=True)).detach().clone()
+        for prompt, features in zip(missing, text_features):
+            _text_features_cache[prompt] = features
+    features = []
+    for prompt in prompts:
+        _text_features_cache.move_to_end(prompt)
+        features.append(_text_features_cache[prompt])
+    while len(_text_features_cache) > _TEXT_FEATURES_CACHE_SIZE:
+        _text_features_cache.popitem(last=False)
+    return torch.stack(features)
+
+def _decode_image(image_path: str) -> "torch.Tensor":
+    """
+    Decode an image file to a uint8 RGB tensor of shape (3, H, W).
+    Uses torchvision's native decoders, falling back to PIL for formats they don't handle.
+    """
+    from torchvision.io import ImageReadMode, read_image
+    from torchvision.transforms import v2
+    from PIL import Image
+    try:
+        return read_image(image_path, mode=ImageReadMode.RGB)
+    except RuntimeError:
+        with Image.open(image_path) as image:
+            return v2.functional.pil_to_tensor(image.convert("RGB"))
+
+def _inference_context() -> contextlib.ExitStack:
+    """inference_mode plus FP16 autocast on CUDA, shared by every encoder call."""
+    import torch
+    stack = contextlib.ExitStack()
+    stack.enter_context(torch.inference_mode())
+    stack.enter_context(torch.autocast(_clip_device, dtype=torch.float16, enabled=_clip_device == "cuda"))
+    return stack
+
+class _EmbeddingStore:
+    """
+    Unit-normalized FP16 image embeddings for one CLIP model, keyed by image content digest.
+    Everything lives in a single .npz (digest array + N x D matrix), so a scoring run loads
+    one file instead of one per image.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._rows: Optional[Dict[str, int]] = None
+        self._matrix: "Optional[np.ndarray]" = None
+
+    def _read(self) -> "Tuple[Dict[str, int], Optional[np.ndarray]]":
+        """Load the store from disk; a missing or unreadable file reads as empty."""
+        import numpy as np
+        try:
+            with np.load(self.path) as data:
+                digests, matrix = data['digests'], data['embeddings']
+        except (OSError, ValueError, KeyError):
+            return {}, None
+        return {str(d): i for i, d in enumerate(digests)}, matrix
+
+    def get_many(self, digests: List[str]) -> "List[Optional[np.ndarray]]":
+        """Return the stored embedding for each digest, or None where there is none."""
+        with self._lock:
+            if self._rows is None:
+                self._rows, self._matrix = self._read()
+            return [self._matrix[self._rows[d]] if d in self._rows else None for d in digests]
+
+    def add_many(self, digests: List[str], embeddings: "np.ndarray") -> None:
+        """Append embeddings for new digests and rewrite the store file atomically."""
+        import numpy as np
+        with self._lock:
+            # Merge with the file as it is now, so rows another run added meanwhile survive
+            rows, matrix = self._read()
+            new = {d: e for d, e in zip(digests, embeddings) if d not in rows}
+            if new:
+                all_digests = sorted(rows, key=rows.get) + list(new)
+                new_matrix = np.stack(list(new.values())).astype(np.float16)
+                matrix = new_matrix if matrix is None else np.concatenate([matrix, new_matrix])
+                rows = {d: i for i, d in enumerate(all_digests)}
+                tmp_path = f"{self.path}.{os.getpid()}.tmp"
+                try:
+                    os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                    with open(tmp_path, 'wb') as f:
+                        np.savez(f, digests=np.array(all_digests), embeddings=matrix)
+                    # Atomic rename so concurrent runs never read a half-written file
+                    os.replace(tmp_path, self.path)
+                except OSError as e:
+                    logger.warning(f"Could not cache CLIP embeddings at {self.path}: {e}")
+            self._rows, self._matrix = rows, matrix
+
+_embedding_store = _EmbeddingStore(_EMB_STORE_PATH)
+
+def _encode_images(image_paths: List[str]) -> "torch.Tensor":
+    """
+    Return normalized CLIP image embeddings for image_paths.
+    Embeddings are cached on disk as unit-normalized FP16 rows keyed by image content,
+    so only unseen images go through the encoder (in a single pass).
+    Must be called with the model loaded and inside _inference_context().
+    """
+    import numpy as np
+    import torch
+    workers = min(len(image_paths), os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        digests = list(pool.map(file_digest, image_paths))
+        embeddings = _embedding_store.get_many(digests)
+        missing = [i for i, emb in enumerate(embeddings) if emb is None]
+        if missing:
+            # Decoding releases the GIL, so it overlaps across threads; resize/normalize then run on _clip_device
+            decoded = list(pool.map(_decode_image, [image_paths[i] for i in missing]))
+    if missing:
+        image_input = torch.stack([_clip_transform(image.to(_clip_device)) for image in decoded])
+        image_features = _clip_model.encode_image(image_input)
+        image_features /= image_features.norm(dim=-1, keepdim=True)
+        fresh = image_features.to(torch.float16).cpu().numpy()
+        for i, embedding in zip(missing, fresh):
+            embeddings[i] = embedding
+        _embedding_store.add_many([digests[i] for i in missing], fresh)
+    # Cached and fresh embeddings both go through FP16, so scores are identical across runs
+    return torch.from_numpy(np.stack(embeddings)).to(device=_clip_device, dtype=_clip_dtype)
+
+def get_image_embedding(image_path: str) -> "torch.Tensor":
+    """
+    Return the normalized CLIP embedding for an image, using the on-disk cache when possible.
+    Args:
+        image_path (str): Path to the image file.
+    Returns:
+        torch.Tensor: Normalized image embedding.
+    """
+    _load_clip()
+    with _inference_context():
+        return _encode_images([image_path])[0]
+
+def encode_text(prompt: str) -> "torch.Tensor":
+    """
+    Encode a text prompt with CLIP once so it can be scored against many images.
+    Embeddings are cached per prompt, so repeated calls are free.
+    Args:
+        prompt (str): Text prompt to encode.
+    Returns:
+        torch.Tensor: Normalized text embedding.
+    """
+    _load_clip()
+    with _inference_context():
+        return _get_text_features([prompt])[0]
 
 # Real CLIP scoring implementation
 
+def score_images_against_text_emb(image_paths: List[str], text_emb: "torch.Tensor") -> "np.ndarray":
+    """
+    Score a batch of images against a precomputed text embedding (see encode_text).
+    Args:
+        image_paths (List[str]): Paths to the image files.
+        text_emb (torch.Tensor): Normalized text embedding.
+    Returns:
+        np.ndarray: Similarity per image, shape (len(image_paths),).
+    """
+    import numpy as np
+    if not image_paths:
+        return np.zeros(0, dtype=np.float32)
+    _load_clip()
+    with _inference_context():
+        return (_encode_images(image_paths) @ text_emb).float().cpu().numpy()
+
+def score_image_against_text_emb(image_path: str, text_emb: "torch.Tensor") -> float:
+    """
+    Score a single image against a precomputed text embedding (see encode_text).
+    Args:
+        image_path (str): Path to the image file.
+        text_emb (torch.Tensor): Normalized text embedding.
+    Returns:
+        float: CLIP similarity score between image and text.
+    """
+    return float(score_images_against_text_emb([image_path], text_emb)[0])
+
+def score_images_with_prompt(image_paths: List[str], prompt: str) -> "np.ndarray":
+    """
+    Score a batch of images against one text prompt, encoding the images in a single forward pass.
+    Args:
+        image_paths (List[str]): Paths to the image files.
+        prompt (str): Text prompt to score against.
+    Returns:
+        np.ndarray: Similarity per image, shape (len(image_paths),).
+    """
+    return score_images_against_text_emb(image_paths, encode_text(prompt))
+
+def score_images_with_prompts(image_paths: List[str], prompts: List[str]) -> "np.ndarray":
+    """
+    Score a batch of images against a batch of text prompts using CLIP in a single forward pass.
+    Args:
+        image_paths (List[str]): Paths to the image files.
+        prompts (List[str]): Text prompts to score against.
+    Returns:
+        np.ndarray: Similarity matrix of shape (len(image_paths), len(prompts)).
+    """
+    import numpy as np
+    if not image_paths or not prompts:
+        return np.zeros((len(image_paths), len(prompts)), dtype=np.float32)
+    _load_clip()
+    with _inference_context():
+        image_features = _encode_images(image_paths)
+        text_features = _get_text_features(prompts)
+        similarity = (image_features @ text_features.T).float().cpu().numpy()
+    return similarity
+
 def score_image_with_prompt(image_path: str, prompt: str) -> float:
     """
     Score an image against a text prompt using CLIP.
@@ -65,18 +363,8 @@ def score_image_with_prompt(image_path: str, prompt: str) -> float:
     Returns:
         float: CLIP similarity score between image and prompt.
     """
-    _load_clip()
     try:
-        image = Image.open(image_path).convert("RGB")
-        image_input = _clip_preprocess(image).unsqueeze(0).to(_clip_device)
-        text_input = open_clip.tokenize([prompt]).to(_clip_device)
-        with torch.no_grad():
-            image_features = _clip_model.encode_image(image_input)
-            text_features = _clip_model.encode_text(text_input)
-            image_features /= image_features.norm(dim=-1, keepdim=True)
-            text_features /= text_features.norm(dim=-1, keepdim=True)
-            similarity = (image_features @ text_features.T).item()
-        return float(similarity)
+        return float(score_images_with_prompts([image_path], [prompt])[0, 0])
     except Exception as e:
         logger.error(f"Error scoring image with CLIP: {e}")
-        return 0.0 
\ No newline at end of file
+        return 0.0
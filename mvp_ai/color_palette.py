@@ -1,11 +1,10 @@
 """
-color_palette.py - Extract color palettes from images using ColorThief for HeritageAI.
+color_palette.py - Extract color palettes from images using k-means clustering for HeritageAI.
 """
 import os
-import json
 import logging
 from typing import List, Tuple, Optional
-from colorthief import ColorThief
+import json_utils
 
 logger = logging.getLogger(__name__)
 
@@ -25,20 +24,66 @@ def extract_palette(
     Returns:
         Tuple[List[str], str]: List of hex color strings and the path to the saved JSON file.
     """
-    if not os.path.exists(image_path):
+    # Imported lazily: numpy/PIL/scikit-learn add noticeable startup time for CLI commands that never extract palettes
+    import numpy as np
+    from PIL import Image
+    from sklearn.cluster import MiniBatchKMeans
+    try:
+        with Image.open(image_path) as img:
+            img = img.convert("RGB")
+            img.thumbnail((200, 200))
+            pixels = np.asarray(img, dtype=np.float32).reshape(-1, 3)
+    except FileNotFoundError:
         logger.error(f"Image not found: {image_path}")
         raise FileNotFoundError(f"Image not found: {image_path}")
-    color_thief = ColorThief(image_path)
-    palette = color_thief.get_palette(color_count=palette_size)
-    # Convert RGB tuples to hex
-    hex_palette = ["#%02x%02x%02x" % color for color in palette]
+    # Flat images (logos, generated patterns) can have fewer colors than palette_size; asking for
+    # more clusters than distinct colors yields duplicate or empty centroids
+    distinct_colors = len(np.unique(pixels, axis=0))
+    kmeans = MiniBatchKMeans(
+        n_clusters=min(palette_size, distinct_colors), n_init=1, batch_size=1024, random_state=0
+    ).fit(pixels)
+    # Dominant colors first; n_clusters <= palette_size, so a plain sort of the counts is all it takes
+    counts = np.bincount(kmeans.labels_, minlength=kmeans.n_clusters)
+    top = np.argsort(-counts, kind='stable')
+    # MiniBatchKMeans can still leave a cluster with no pixels; it isn't a color in the image
+    top = top[counts[top] > 0]
+    centers = kmeans.cluster_centers_[top].round().astype(np.uint8)
+    # Convert RGB centers to hex in one pass over the raw bytes
+    hex_digits = np.ascontiguousarray(centers).tobytes().hex()
+    hex_palette = ['#' + hex_digits[i:i + 6] for i in range(0, len(hex_digits), 6)]
     # Save to JSON
     assets_dir = os.path.dirname(image_path)
     if not output_name:
         base = os.path.splitext(os.path.basename(image_path))[0]
         output_name = f"{base}_palette.json"
     output_path = os.path.join(assets_dir, output_name)
-    with open(output_path, 'w') as f:
-        json.dump({"palette": hex_palette}, f, indent=2)
+    # palette_size is recorded because flat images legitimately yield fewer colors than requested
+    json_utils.dump({"palette": hex_palette, "palette_size": palette_size}, output_path)
     logger.info(f"Extracted palette for {image_path}: {hex_palette} (saved to {output_path})")
-    return hex_palette, output_path 
\ No newline at end of file
+    return hex_palette, output_path
+
+def load_or_extract_palette(image_path: str, palette_size: int = 5) -> Tuple[List[str], str]:
+    """
+    Return the image's palette from its `<name>_palette.json` sidecar when that is newer than
+    the image and was extracted with palette_size colors; otherwise extract (and save) it again.
+
+    Args:
+        image_path (str): Path to the image file.
+        palette_size (int): Number of colors to extract (default: 5).
+
+    Returns:
+        Tuple[List[str], str]: List of hex color strings and the path to the palette JSON file.
+    """
+    base = os.path.splitext(os.path.basename(image_path))[0]
+    palette_path = os.path.join(os.path.dirname(image_path), f"{base}_palette.json")
+    try:
+        # A sidecar older than the image belongs to an earlier image with the same name
+        if os.stat(palette_path).st_mtime >= os.stat(image_path).st_mtime:
+            saved = json_utils.load(palette_path)
+            palette = saved["palette"]
+            # Sidecars written before palette_size was recorded always hold the full count
+            if saved.get("palette_size", len(palette)) == palette_size:
+                return palette, palette_path
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return extract_palette(image_path, palette_size)
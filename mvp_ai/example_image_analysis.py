@@ -5,7 +5,7 @@ Demonstrates how HeritageAI analyzes actual images to extract design elements
 """
 
 import os
-import json
+import json_utils
 from ai_culture_generator import ai_culture_generator
 
 def analyze_cultural_image(culture: str, image_path: str):
@@ -65,8 +65,7 @@ def analyze_cultural_image(culture: str, image_path: str):
         
         # Save results
         output_file = f"{culture}_image_analysis.json"
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(metadata, f, indent=2, ensure_ascii=False)
+        json_utils.dump(metadata, output_file)
         
         print(f"\n💾 Analysis saved to: {output_file}")
         
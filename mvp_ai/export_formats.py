@@ -2,13 +2,16 @@
 export_formats.py - Export design kits and assets in multiple formats for HeritageAI.
 """
 import os
-import json
 import base64
+import functools
 import logging
-from typing import Any, Dict, List, Optional, Union
-from PIL import Image
+import threading
+from typing import Any, Dict, List, Optional
 import io
-from ai_culture_generator import ai_culture_generator
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+import json_utils
+from _cache import SqliteCache
 
 logger = logging.getLogger(__name__)
 
@@ -23,6 +26,8 @@ def get_culture_specific_fonts(culture: str, image_path: Optional[str] = None) -
     """
     try:
         if image_path and os.path.exists(image_path):
+            # Deferred: the AI generator (and its Gemini client) is only needed for image analysis
+            from ai_culture_generator import ai_culture_generator
             return ai_culture_generator.generate_culture_fonts(culture, image_path)
         else:
             return ['Nunito', 'Open Sans', 'Roboto', 'Lato']
@@ -41,6 +46,7 @@ def get_culture_specific_elements(culture: str, image_path: Optional[str] = None
     """
     try:
         if image_path and os.path.exists(image_path):
+            from ai_culture_generator import ai_culture_generator
             return ai_culture_generator.generate_culture_elements(culture, image_path)
         else:
             return [
@@ -65,17 +71,13 @@ def export_to_css(palette: Dict[str, Any], filename: str = "palette.css") -> str
     Returns:
         str: CSS content as a string.
     """
-    css_content = f"""/* {palette.get('note', 'Cultural Color Palette')} */\n:root {{\n"""
-    for i, color in enumerate(palette.get('colors', [])):
-        css_content += f"  --color-{i+1}: {color};\n"
-    if 'primary' in palette:
-        css_content += f"  --primary: {palette['primary']};\n"
-    if 'secondary' in palette:
-        css_content += f"  --secondary: {palette['secondary']};\n"
-    if 'accent' in palette:
-        css_content += f"  --accent: {palette['accent']};\n"
-    css_content += "}\n"
-    return css_content
+    lines = [f"/* {palette.get('note', 'Cultural Color Palette')} */", ":root {"]
+    lines += [f"  --color-{i+1}: {color};" for i, color in enumerate(palette.get('colors', []))]
+    for key in ('primary', 'secondary', 'accent'):
+        if key in palette:
+            lines.append(f"  --{key}: {palette[key]};")
+    lines.append("}")
+    return "\n".join(lines) + "\n"
 
 def export_to_json(assets_data: Any, filename: str = "assets.json") -> str:
     """
@@ -86,30 +88,93 @@ def export_to_json(assets_data: Any, filename: str = "assets.json") -> str:
     Returns:
         str: JSON string.
     """
-    return json.dumps(assets_data, indent=2)
+    return json_utils.dumps(assets_data).decode()
 
-def image_to_base64_svg(image_path: str, width: int = 200, height: int = 200) -> Optional[str]:
+# Formats that can be embedded in an SVG data URI as-is
+_EMBED_MIME_TYPES = {'PNG': 'image/png', 'JPEG': 'image/jpeg', 'WEBP': 'image/webp'}
+
+def _render_svg(image_path: str, width: int, height: int) -> bytes:
+    """Build the embedded-image SVG document for image_path; raises on failure."""
+    from PIL import Image
+    with Image.open(image_path) as img:
+        mime_type = _EMBED_MIME_TYPES.get(img.format)
+        if mime_type and img.width <= width and img.height <= height:
+            with open(image_path, 'rb') as f:
+                image_bytes = f.read()
+        else:
+            img = img.resize((width, height), Image.Resampling.LANCZOS)
+            buffer = io.BytesIO()
+            img.save(buffer, format='WEBP', quality=85, method=4)
+            image_bytes = buffer.getvalue()
+            mime_type = 'image/webp'
+    prefix = f'<svg width="{width}" height="{height}" xmlns="http://www.w3.org/2000/svg">\n  <image href="data:{mime_type};base64,'.encode()
+    suffix = f'" width="{width}" height="{height}"/>\n</svg>'.encode()
+    return b''.join((prefix, base64.b64encode(image_bytes), suffix))
+
+# Rendered SVGs are kept this long on disk; entries for regenerated or deleted images just age out
+SVG_CACHE_TTL = int(os.getenv('SVG_CACHE_TTL', 30 * 24 * 3600))
+_svg_disk_cache: Optional[SqliteCache] = None
+# Guards the lazy open; export_kit_formats renders from several threads at once
+_svg_disk_cache_lock = threading.Lock()
+
+def _get_svg_disk_cache() -> SqliteCache:
+    """Open the on-disk SVG cache on first use, dropping expired entries once per process."""
+    global _svg_disk_cache
+    if _svg_disk_cache is None:
+        with _svg_disk_cache_lock:
+            if _svg_disk_cache is None:
+                # lru_cache is the in-memory tier, so the SqliteCache keeps no memory copy of its own
+                cache = SqliteCache('svg_embeds.sqlite3', memory_size=0, ttl=SVG_CACHE_TTL)
+                cache.purge_expired()
+                _svg_disk_cache = cache
+    return _svg_disk_cache
+
+@functools.lru_cache(maxsize=256)
+def _cached_svg(image_path: str, mtime_ns: int, width: int, height: int) -> bytes:
+    """Return the SVG for an image version, checking the on-disk cache before rendering."""
+    disk_cache = _get_svg_disk_cache()
+    key = f"{image_path}:{mtime_ns}:{width}x{height}"
+    svg = disk_cache.get(key)
+    if svg is None:
+        svg = _render_svg(image_path, width, height)
+        disk_cache.set(key, svg)
+    return svg
+
+def image_to_base64_svg(image_path: str, width: int = 200, height: int = 200) -> Optional[bytes]:
     """
     Convert image to base64-encoded SVG for embedding.
+    Images that already fit within width x height in a web format are embedded byte-for-byte;
+    larger ones are resized and re-encoded as WebP. Results are memoized per (path, mtime, size),
+    so a modified file is re-rendered automatically.
     Args:
         image_path (str): Path to the image file.
         width (int): Width of the SVG.
         height (int): Height of the SVG.
     Returns:
-        Optional[str]: SVG string or None if conversion fails.
+        Optional[bytes]: UTF-8 encoded SVG document or None if conversion fails.
     """
     try:
-        with Image.open(image_path) as img:
-            img = img.resize((width, height), Image.Resampling.LANCZOS)
-            buffer = io.BytesIO()
-            img.save(buffer, format='PNG')
-            img_base64 = base64.b64encode(buffer.getvalue()).decode()
-            svg_content = f"""<svg width=\"{width}\" height=\"{height}\" xmlns=\"http://www.w3.org/2000/svg\">\n  <image href=\"data:image/png;base64,{img_base64}\" width=\"{width}\" height=\"{height}\"/>\n</svg>"""
-            return svg_content
+        mtime_ns = os.stat(image_path).st_mtime_ns
+        return _cached_svg(os.path.abspath(image_path), mtime_ns, width, height)
     except Exception as e:
         logger.error(f"Error converting image to SVG: {e}")
         return None
 
+def _collect_kit_colors(kit_metadata: Dict[str, Any], ai_analysis: Dict[str, Any]) -> List[str]:
+    """
+    Collect unique, lowercased colors from every kit palette followed by the AI colors.
+    Args:
+        kit_metadata (Dict[str, Any]): Metadata for the kit.
+        ai_analysis (Dict[str, Any]): AI analysis section of the kit metadata.
+    Returns:
+        List[str]: Deduplicated hex colors in first-seen order.
+    """
+    colors = itertools.chain(
+        itertools.chain.from_iterable(p['colors'] for p in kit_metadata['assets']['palettes'] if 'colors' in p),
+        ai_analysis.get('ai_colors') or []
+    )
+    return list(dict.fromkeys(color.lower() for color in colors))
+
 def create_figma_plugin_data(kit_metadata: Dict[str, Any], kit_dir: str) -> Dict[str, Any]:
     """
     Create data structure for Figma plugin integration with AI-generated data.
@@ -126,34 +191,25 @@ def create_figma_plugin_data(kit_metadata: Dict[str, Any], kit_dir: str) -> Dict
     figma_data: Dict[str, Any] = {
         "name": f"{culture.title()} Cultural Design Kit",
         "description": f"AI-generated design assets inspired by {culture} culture",
-        "colors": [],
+        "colors": _collect_kit_colors(kit_metadata, ai_analysis),
         "images": [],
         "fonts": fonts,
         "elements": elements,
         "ai_analysis": ai_analysis,
         "metadata": kit_metadata
     }
-    for palette in kit_metadata['assets']['palettes']:
-        if 'colors' in palette:
-            figma_data['colors'].extend(palette['colors'])
-    if ai_analysis.get('ai_colors'):
-        figma_data['colors'].extend(ai_analysis['ai_colors'])
-    seen = set()
-    unique_colors = []
-    for color in figma_data['colors']:
-        if color not in seen:
-            seen.add(color)
-            unique_colors.append(color)
-    figma_data['colors'] = unique_colors
     for pattern_name in kit_metadata['assets']['patterns']:
         pattern_path = os.path.join(kit_dir, pattern_name)
-        if os.path.exists(pattern_path):
-            figma_data['images'].append({
-                "name": pattern_name,
-                "path": pattern_name,
-                "type": "pattern",
-                "size": os.path.getsize(pattern_path)
-            })
+        try:
+            st = os.stat(pattern_path)
+        except FileNotFoundError:
+            continue
+        figma_data['images'].append({
+            "name": pattern_name,
+            "path": pattern_name,
+            "type": "pattern",
+            "size": st.st_size
+        })
     return figma_data
 
 def create_canva_template_data(kit_metadata: Dict[str, Any], kit_dir: str) -> Dict[str, Any]:
@@ -172,7 +228,7 @@ def create_canva_template_data(kit_metadata: Dict[str, Any], kit_dir: str) -> Di
     canva_data: Dict[str, Any] = {
         "template_name": f"{culture.title()} Cultural Template",
         "brand_kit": {
-            "colors": [],
+            "colors": _collect_kit_colors(kit_metadata, ai_analysis),
             "fonts": fonts,
             "elements": elements
         },
@@ -182,49 +238,54 @@ def create_canva_template_data(kit_metadata: Dict[str, Any], kit_dir: str) -> Di
         "generated_at": kit_metadata.get('generated_at', ''),
         "version": "2.0"
     }
-    for palette in kit_metadata['assets']['palettes']:
-        if 'colors' in palette:
-            canva_data['brand_kit']['colors'].extend(palette['colors'])
-    if ai_analysis.get('ai_colors'):
-        canva_data['brand_kit']['colors'].extend(ai_analysis['ai_colors'])
-    seen = set()
-    unique_colors = []
-    for color in canva_data['brand_kit']['colors']:
-        if color not in seen:
-            seen.add(color)
-            unique_colors.append(color)
-    canva_data['brand_kit']['colors'] = unique_colors
     return canva_data
 
+def _write_css(kit_dir: str, kit_metadata: Dict[str, Any]) -> Optional[str]:
+    """Write palette.css for the kit's first palette, if any, and return its path."""
+    if not kit_metadata['assets']['palettes']:
+        return None
+    css_content = export_to_css(kit_metadata['assets']['palettes'][0])
+    css_path = os.path.join(kit_dir, "palette.css")
+    with open(css_path, 'w') as f:
+        f.write(css_content)
+    return css_path
+
+def _write_kit_json(kit_dir: str, kit_metadata: Dict[str, Any]) -> str:
+    """Write kit_data.json and return its path."""
+    json_path = os.path.join(kit_dir, "kit_data.json")
+    json_utils.dump(kit_metadata, json_path)
+    return json_path
+
+def _write_figma(kit_dir: str, kit_metadata: Dict[str, Any]) -> str:
+    """Write figma_plugin.json and return its path."""
+    figma_path = os.path.join(kit_dir, "figma_plugin.json")
+    json_utils.dump(create_figma_plugin_data(kit_metadata, kit_dir), figma_path)
+    return figma_path
+
+def _write_canva(kit_dir: str, kit_metadata: Dict[str, Any]) -> str:
+    """Write canva_template.json and return its path."""
+    canva_path = os.path.join(kit_dir, "canva_template.json")
+    json_utils.dump(create_canva_template_data(kit_metadata, kit_dir), canva_path)
+    return canva_path
+
 def export_kit_formats(kit_dir: str, kit_metadata: Dict[str, Any]) -> Dict[str, str]:
     """
     Export kit in multiple formats for different platforms.
+    The writers touch separate files, so they run concurrently on a thread pool.
     Args:
         kit_dir (str): Directory to export files to.
         kit_metadata (Dict[str, Any]): Metadata for the kit.
     Returns:
         Dict[str, str]: Mapping of format names to file paths.
     """
-    exports: Dict[str, str] = {}
-    if kit_metadata['assets']['palettes']:
-        css_content = export_to_css(kit_metadata['assets']['palettes'][0])
-        css_path = os.path.join(kit_dir, "palette.css")
-        with open(css_path, 'w') as f:
-            f.write(css_content)
-        exports['css'] = css_path
-    json_content = export_to_json(kit_metadata)
-    json_path = os.path.join(kit_dir, "kit_data.json")
-    with open(json_path, 'w') as f:
-        f.write(json_content)
-    exports['json'] = json_path
-    figma_data = create_figma_plugin_data(kit_metadata, kit_dir)
-    figma_path = os.path.join(kit_dir, "figma_plugin.json")
-    with open(figma_path, 'w') as f:
-        json.dump(figma_data, f, indent=2)
-    exports['figma'] = figma_path
-    canva_data = create_canva_template_data(kit_metadata, kit_dir)
-    canva_path = os.path.join(kit_dir, "canva_template.json")
-    with open(canva_path, 'w') as f:
-        json.dump(canva_data, f, indent=2)
-    exports['canva'] = canva_path
-    return exports 
\ No newline at end of file
+    writers = {
+        'css': _write_css,
+        'json': _write_kit_json,
+        'figma': _write_figma,
+        'canva': _write_canva
+    }
+    with ThreadPoolExecutor(max_workers=len(writers)) as pool:
+        futures = {name: pool.submit(writer, kit_dir, kit_metadata) for name, writer in writers.items()}
+        paths = {name: future.result() for name, future in futures.items()}
+    exports: Dict[str, str] = {name: path for name, path in paths.items() if path}
+    return exports
@@ -1,23 +1,193 @@
 import os
 import time
-import requests
-import json
+import base64
+import random
+import atexit
+import asyncio
+import threading
+import contextvars
+import httpx
+import hashlib
 import logging
-from typing import List, Optional, Dict, Any
-from dotenv import load_dotenv
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Dict, Any, AsyncIterator, Iterator
+import json_utils
+from _cache import SqliteCache, file_digest, text_digest
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
 
-load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '.env'))
 logger = logging.getLogger(__name__)
 
-class GeminiClient:
-    """Client for interacting with Gemini and Imagen APIs, with robust retry and error handling."""
+# Directory generated images are written to
+_ASSETS_DIR = Path(__file__).resolve().parent / 'assets'
+
+_MIME_TYPES = {
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.gif': 'image/gif',
+    '.webp': 'image/webp'
+}
+
+CULTURE_DETAILS_PROMPT_TMPL = (
+    "For the {culture} culture, provide:\n"
+    "- 3 to 5 of the most iconic textile motifs or symbols (with names and meanings if possible)\n"
+    "- The traditional color palette (with color names or hex codes)\n"
+    "- The typical arrangement style of motifs (e.g., rows, bands, all-over, grid)\n"
+    "- Notable textile techniques or materials\n"
+    "- One or two 'do's and don'ts' for authentic design\n"
+    "Return your answer as a concise, richly descriptive paragraph."
+)
+
+# Lets one generateContent call answer several independent prompts
+BATCH_SYSTEM_INSTRUCTION = (
+    "You will receive {count} numbered prompts. Answer each one independently, exactly as if it "
+    "had been sent on its own. Reply with only a JSON array of {count} strings, where element i "
+    "is your complete answer to prompt i+1."
+)
+
+# Retryable HTTP status -> (base delay attribute, rotate API key, log message)
+_STATUS_RETRY_POLICY = {
+    429: ('retry_delay_429', True, None),
+    500: ('retry_delay_500', False, "⚠️ Internal server error. Retrying in {delay:.2f} seconds..."),
+    502: ('retry_delay_503', False, "⏳ Bad gateway. Retrying in {delay:.2f} seconds..."),
+    503: ('retry_delay_503', False, "⏳ Service is unavailable. Retrying in {delay:.2f} seconds..."),
+    504: ('retry_delay_503', False, "⏳ Gateway timeout. Retrying in {delay:.2f} seconds..."),
+}
+
+# Statuses returned when a referenced file URI no longer exists or isn't visible to the key
+_STALE_FILE_STATUSES = frozenset({400, 403, 404})
+
+class GeminiHTTPError(Exception):
+    """HTTP error response from a Gemini endpoint, carrying the status code and any Retry-After hint."""
+    def __init__(self, message: str, status_code: int, retry_after: Optional[float] = None) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+def _raise_for_status(response) -> None:
+    """Raise GeminiHTTPError for a 4xx/5xx httpx response"""
+    if response.status_code < 400:
+        return
+    reason = getattr(response, 'reason', None) or getattr(response, 'reason_phrase', '')
+    retry_after = None
+    header = response.headers.get("Retry-After")
+    if header:
+        try:
+            retry_after = float(header)
+        except ValueError:
+            # HTTP-date form is not used by Gemini; fall back to computed backoff
+            pass
+    raise GeminiHTTPError(f"{response.status_code} {reason} for url: {response.url}", response.status_code, retry_after)
+
+# Index of the API key used by the current thread/task's most recent request, so a 429
+# cools down the key that actually failed even when other callers have rotated since
+_active_key_index: "contextvars.ContextVar[Optional[int]]" = contextvars.ContextVar('gemini_active_key_index', default=None)
+
+class CircuitOpenError(Exception):
+    """Raised without touching the network while an endpoint's circuit breaker is open."""
+
+class _CircuitBreaker:
+    """
+    Counts consecutive failures (5xx or transport errors) per endpoint path. Once the threshold is
+    reached, requests to that endpoint fail immediately until the cooldown has passed; the next
+    request is then let through, and a success closes the circuit again.
+    """
+    def __init__(self, threshold: int, cooldown: float) -> None:
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures: Dict[str, int] = {}
+        self._opened_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+    
+    def check(self, endpoint: str) -> None:
+        with self._lock:
+            opened_at = self._opened_at.get(endpoint)
+        if opened_at is not None and time.monotonic() - opened_at < self.cooldown:
+            raise CircuitOpenError(f"Circuit open for {endpoint}; failing fast for up to {self.cooldown:.0f}s")
+    
+    def record(self, endpoint: str, failed: bool) -> None:
+        with self._lock:
+            if not failed:
+                self._failures.pop(endpoint, None)
+                self._opened_at.pop(endpoint, None)
+                return
+            failures = self._failures.get(endpoint, 0) + 1
+            self._failures[endpoint] = failures
+            if failures >= self.threshold:
+                self._opened_at[endpoint] = time.monotonic()
+        if failures >= self.threshold:
+            logger.error(f"🔌 {endpoint} failed {failures} times in a row; opening circuit for {self.cooldown:.0f}s")
+
+class _BreakerTransport(httpx.BaseTransport):
+    """Sync transport wrapper that consults and updates a circuit breaker per request path."""
+    def __init__(self, transport: httpx.BaseTransport, breaker: _CircuitBreaker) -> None:
+        self._transport = transport
+        self._breaker = breaker
+    
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        endpoint = request.url.path
+        self._breaker.check(endpoint)
+        try:
+            response = self._transport.handle_request(request)
+        except httpx.TransportError:
+            self._breaker.record(endpoint, failed=True)
+            raise
+        self._breaker.record(endpoint, failed=response.status_code >= 500)
+        return response
+    
+    def close(self) -> None:
+        self._transport.close()
+
+class _AsyncBreakerTransport(httpx.AsyncBaseTransport):
+    """Async transport wrapper that consults and updates a circuit breaker per request path."""
+    def __init__(self, transport: httpx.AsyncBaseTransport, breaker: _CircuitBreaker) -> None:
+        self._transport = transport
+        self._breaker = breaker
+    
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        endpoint = request.url.path
+        self._breaker.check(endpoint)
+        try:
+            response = await self._transport.handle_async_request(request)
+        except httpx.TransportError:
+            self._breaker.record(endpoint, failed=True)
+            raise
+        self._breaker.record(endpoint, failed=response.status_code >= 500)
+        return response
+    
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+class _GeminiClientBase:
+    """Shared configuration, key rotation and payload helpers for the sync and async Gemini clients."""
+    # Fail fast on a stuck connect/TLS handshake; generous read window for image generation
+    DEFAULT_TIMEOUT = httpx.Timeout(60, connect=5)
+    
     def __init__(self) -> None:
+        from dotenv import load_dotenv
+        load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '.env'))
         self.api_keys = self._load_api_keys()
         self.current_key_index = 0
+        self._key_lock = threading.Lock()
+        # Key index -> time.monotonic() at which a rate-limited key may be used again
+        self._key_cooldowns: Dict[int, float] = {}
+        self.key_cooldown = float(os.getenv('KEY_COOLDOWN', 60))
         self.max_retries = int(os.getenv('MAX_RETRIES', 3))
         self.retry_delay_429 = int(os.getenv('RETRY_DELAY_429', 2000))
         self.retry_delay_503 = int(os.getenv('RETRY_DELAY_503', 3000))
         self.retry_delay_500 = int(os.getenv('RETRY_DELAY_500', 2000))
+        self.retry_delay_timeout = int(os.getenv('RETRY_DELAY_TIMEOUT', 2000))
+        self.retry_delay_cap = int(os.getenv('RETRY_DELAY_CAP', 30000))
+        self.breaker = _CircuitBreaker(
+            threshold=int(os.getenv('CIRCUIT_BREAKER_THRESHOLD', 5)),
+            cooldown=float(os.getenv('CIRCUIT_BREAKER_COOLDOWN', 30))
+        )
         
         # API endpoints
         self.imagen_url = "https://generativelanguage.googleapis.com/v1beta/models/imagen-3.0-generate-002:predict"
@@ -25,9 +195,21 @@ class GeminiClient:
         self.image_url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
         self.upload_url = "https://generativelanguage.googleapis.com/upload/v1beta/files"
         
+        # Image-analysis responses keyed by image content and prompt
+        self.analysis_cache = SqliteCache('image_analysis.sqlite3')
+        # Gemini file URIs by image content and API key; uploads expire server-side after 48h
+        self.upload_cache = SqliteCache('uploaded_files.sqlite3', ttl=47 * 3600)
+        # Text responses keyed by prompt; culture prompts are deterministic so repeats are free
+        self.text_cache = SqliteCache('text_responses.sqlite3', ttl=int(os.getenv('GEMINI_CACHE_TTL', 7 * 24 * 3600)))
+        
         if not self.api_keys:
             raise ValueError("No Gemini API keys found in environment variables")
     
+    def _close_caches(self) -> None:
+        """Release the response caches' SQLite connections"""
+        for cache in (self.analysis_cache, self.upload_cache, self.text_cache):
+            cache.close()
+    
     def _load_api_keys(self) -> List[str]:
         """Load multiple API keys from environment variables"""
         keys = []
@@ -49,45 +231,226 @@ class GeminiClient:
     
     def _get_current_api_key(self) -> str:
         """Get current API key"""
-        return self.api_keys[self.current_key_index]
+        with self._key_lock:
+            index = self.current_key_index
+        _active_key_index.set(index)
+        return self.api_keys[index]
     
-    def _switch_api_key(self):
-        """Switch to next API key"""
-        self.current_key_index = (self.current_key_index + 1) % len(self.api_keys)
-        logger.warning(f"🔄 Switched to API key {self.current_key_index + 1}/{len(self.api_keys)}")
+    def _switch_api_key(self, failed_index: Optional[int] = None, cooldown: Optional[float] = None) -> bool:
+        """
+        Put a rate-limited key on cooldown and move to the next key that isn't cooling down.
+        If another caller already rotated away from failed_index, the current key is kept.
+        Returns True if the key now in use is not cooling down.
+        """
+        with self._key_lock:
+            key_count = len(self.api_keys)
+            if failed_index is None:
+                failed_index = self.current_key_index
+            now = time.monotonic()
+            self._key_cooldowns[failed_index] = now + (cooldown if cooldown is not None else self.key_cooldown)
+            if failed_index != self.current_key_index:
+                return self._key_cooldowns.get(self.current_key_index, 0) <= now
+            candidates = [(failed_index + step) % key_count for step in range(1, key_count + 1)]
+            ready = [i for i in candidates if self._key_cooldowns.get(i, 0) <= now]
+            # With every key cooling down, use the one that recovers first
+            self.current_key_index = ready[0] if ready else min(candidates, key=lambda i: self._key_cooldowns[i])
+            current = self.current_key_index
+        logger.warning(f"🔄 Switched to API key {current + 1}/{key_count}")
+        return bool(ready)
     
-    def _handle_error(self, error: Exception, retry_count: int, max_retries: int) -> bool:
-        """Handle different types of errors and decide whether to retry"""
-        error_msg = str(error).lower()
-        
+    def _backoff(self, base_ms: int, retry_count: int, error: Exception, honor_retry_after: bool = True) -> float:
+        """
+        Full-jitter exponential backoff in seconds: uniform(0, min(cap, base * 2**retry_count)).
+        A Retry-After value sent by the server takes precedence (clamped to the cap) unless
+        honor_retry_after is False, e.g. when the retry goes out on a different, ready key.
+        """
+        retry_after = getattr(error, 'retry_after', None)
+        if retry_after is not None and honor_retry_after:
+            return min(retry_after, self.retry_delay_cap / 1000)
+        return random.uniform(0, min(self.retry_delay_cap, base_ms * (2 ** retry_count))) / 1000
+    
+    def _retry_delay(self, error: Exception, retry_count: int, max_retries: int) -> Optional[float]:
+        """Classify an error and return the number of seconds to wait before retrying, or None to give up"""
         if retry_count >= max_retries:
             logger.error(f"❌ Maximum retry attempts ({max_retries}) reached")
-            return False
+            return None
+        
+        if isinstance(error, GeminiHTTPError):
+            policy = _STATUS_RETRY_POLICY.get(error.status_code)
+            if policy is None:
+                logger.error(f"⚠️ Unexpected error: {error}")
+                return None
+            delay_attr, rotate_key, message = policy
+            switched_to_ready_key = False
+            if rotate_key:
+                failed_index = _active_key_index.get()
+                if failed_index is None:
+                    failed_index = self.current_key_index
+                logger.warning(f"🚨 API key {failed_index + 1} limit exhausted, switching...")
+                switched_to_ready_key = self._switch_api_key(failed_index, error.retry_after)
+            # Retry-After describes the failed key; a ready replacement key needn't wait it out
+            delay = self._backoff(getattr(self, delay_attr), retry_count, error, honor_retry_after=not switched_to_ready_key)
+            if message:
+                logger.warning(message.format(delay=delay))
+            return delay
         
-        if "429" in error_msg or "too many requests" in error_msg:
-            logger.warning(f"🚨 API key {self.current_key_index + 1} limit exhausted, switching...")
-            self._switch_api_key()
-            time.sleep(self.retry_delay_429 / 1000)
-            return True
+        if isinstance(error, CircuitOpenError):
+            logger.error(f"🔌 {error}")
+            return None
         
-        elif "503" in error_msg or "service unavailable" in error_msg:
-            logger.warning(f"⏳ Service is unavailable. Retrying in {self.retry_delay_503/1000} seconds...")
-            time.sleep(self.retry_delay_503 / 1000)
-            return True
+        if isinstance(error, httpx.TimeoutException):
+            delay = self._backoff(self.retry_delay_timeout, retry_count, error)
+            logger.warning(f"⏱️ Request timeout. Retrying in {delay:.2f} seconds...")
+            return delay
         
-        elif "500" in error_msg or "internal server error" in error_msg:
-            logger.warning(f"⚠️ Internal server error. Retrying in {self.retry_delay_500/1000} seconds...")
-            time.sleep(self.retry_delay_500 / 1000)
-            return True
+        if isinstance(error, httpx.TransportError):
+            delay = self._backoff(self.retry_delay_timeout, retry_count, error)
+            logger.warning(f"🔌 Connection error ({error}). Retrying in {delay:.2f} seconds...")
+            return delay
         
-        elif "timeout" in error_msg:
-            logger.warning(f"⏱️ Request timeout. Retrying in 2 seconds...")
-            time.sleep(2)
-            return True
+        logger.error(f"⚠️ Unexpected error: {error}")
+        return None
+    
+    def _image_request_body(self, prompt: str, sample_count: int, aspect_ratio: str) -> Dict[str, Any]:
+        """Build the Imagen :predict request body"""
+        return {
+            "instances": [{"prompt": prompt}],
+            "parameters": {"sampleCount": sample_count, "aspectRatio": aspect_ratio}
+        }
+    
+    def _save_predictions(self, result: Dict[str, Any], sample_count: int, filename: Optional[str]):
+        """Decode and save the images in an already-parsed Imagen response, returning the saved path(s)"""
+        writer = _PredictionWriter(sample_count, filename)
+        try:
+            for img_obj in result.get("predictions", []):
+                writer.add(img_obj)
+            return writer.finish()
+        finally:
+            writer.close()
+    
+    def _text_request_body(self, prompt: str) -> Dict[str, Any]:
+        """Build a text-only generateContent request body"""
+        return {
+            "contents": [{"parts": [{"text": prompt}]}]
+        }
+    
+    def _batch_request_body(self, prompts: List[str]) -> Dict[str, Any]:
+        """Build a generateContent request body asking for a JSON array of answers, one per prompt"""
+        return {
+            "systemInstruction": {"parts": [{"text": BATCH_SYSTEM_INSTRUCTION.format(count=len(prompts))}]},
+            "contents": [{"parts": [{"text": f"Prompt {i + 1}:\n{p}"} for i, p in enumerate(prompts)]}],
+            "generationConfig": {"responseMimeType": "application/json"}
+        }
+    
+    def _parse_batch_text(self, text: str, count: int) -> Optional[List[str]]:
+        """Parse a batched reply into count answers, or None if it isn't a JSON array of that many strings"""
+        try:
+            answers = json_utils.loads(text)
+        except ValueError:
+            return None
+        if not isinstance(answers, list) or len(answers) != count or not all(isinstance(a, str) for a in answers):
+            return None
+        return [a.strip() for a in answers]
+    
+    def _analysis_request_body(self, image_path: str, file_uri: str, prompt: str) -> Dict[str, Any]:
+        """Build a generateContent request body referencing an uploaded image"""
+        return {
+            "contents": [{
+                "parts": [
+                    {
+                        "file_data": {
+                            "mime_type": self._get_mime_type(image_path),
+                            "file_uri": file_uri
+                        }
+                    },
+                    {"text": prompt}
+                ]
+            }]
+        }
+    
+    def _response_text(self, result: Dict[str, Any]) -> str:
+        """Extract the first candidate's text from a generateContent response"""
+        return result['candidates'][0]['content']['parts'][0]['text'].strip()
+    
+    def _upload_start_headers(self, image_path: str, api_key: str) -> Dict[str, str]:
+        """Headers that open a resumable upload session for image_path under api_key"""
+        return {
+            "x-goog-api-key": api_key,
+            "X-Goog-Upload-Protocol": "resumable",
+            "X-Goog-Upload-Command": "start",
+            "X-Goog-Upload-Header-Content-Length": str(os.path.getsize(image_path)),
+            "X-Goog-Upload-Header-Content-Type": self._get_mime_type(image_path),
+            "Content-Type": "application/json"
+        }
+    
+    def _upload_finalize_headers(self, image_path: str, api_key: str) -> Dict[str, str]:
+        """Headers that send the file bytes and finalize a resumable upload under api_key"""
+        return {
+            "x-goog-api-key": api_key,
+            "Content-Length": str(os.path.getsize(image_path)),
+            "X-Goog-Upload-Offset": "0",
+            "X-Goog-Upload-Command": "upload, finalize"
+        }
+    
+    def _text_cache_key(self, prompt: str) -> str:
+        """Cache key for a text prompt"""
+        return hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+    
+    def _batch_text_cache_key(self, prompt: str) -> str:
+        """Cache key for a prompt's answer split out of a batched request (kept apart from single-prompt answers)"""
+        return f"batch:{self._text_cache_key(prompt)}"
+    
+    def _analysis_cache_key(self, image_digest: str, prompt: str) -> str:
+        """Cache key for an image analysis: image content digest plus prompt digest"""
+        return f"{image_digest}:{text_digest(prompt)}"
+    
+    def _upload_cache_key(self, image_digest: str, api_key: str) -> str:
+        """Cache key for an uploaded file; uploads are only visible to the project that made them"""
+        return f"{image_digest}:{text_digest(api_key)}"
+
+    @staticmethod
+    def _get_mime_type(image_path: str) -> str:
+        ext = os.path.splitext(image_path)[1].lower()
+        return _MIME_TYPES.get(ext, 'image/jpeg')
+
+    def _culture_details_prompt(self, culture: str) -> str:
+        """Prompt asking for a culture's textile motifs, palette, arrangement and techniques"""
+        return CULTURE_DETAILS_PROMPT_TMPL.format(culture=culture.title())
+
+class GeminiClient(_GeminiClientBase):
+    """Client for interacting with Gemini and Imagen APIs, with robust retry and error handling."""
+    def __init__(self) -> None:
+        super().__init__()
         
-        else:
-            logger.error(f"⚠️ Unexpected error: {error}")
+        # One HTTP/2 connection to generativelanguage.googleapis.com multiplexes every
+        # request stream; the transport retries failed connection attempts
+        self.client = httpx.Client(
+            transport=_BreakerTransport(
+                httpx.HTTPTransport(
+                    http2=True,
+                    limits=httpx.Limits(max_connections=32, max_keepalive_connections=16),
+                    retries=self.max_retries
+                ),
+                self.breaker
+            ),
+            timeout=self.DEFAULT_TIMEOUT,
+            headers={"Content-Type": "application/json"}
+        )
+        # Per-instance memo of culture details by normalized culture name; failures raise and aren't cached
+        self._culture_details_memo = functools.lru_cache(maxsize=256)(self._fetch_culture_details)
+    
+    def close(self) -> None:
+        """Close the pooled HTTP/2 connections and the cache databases"""
+        self.client.close()
+        self._close_caches()
+    
+    def _handle_error(self, error: Exception, retry_count: int, max_retries: int) -> bool:
+        """Handle different types of errors and decide whether to retry"""
+        delay = self._retry_delay(error, retry_count, max_retries)
+        if delay is None:
             return False
+        time.sleep(delay)
+        return True
     
     def generate_image(self, prompt: str, sample_count: int = 4, filename: Optional[str] = None, aspect_ratio: str = "1:1") -> Optional[List[str]]:
         """Generate image with retry logic"""
@@ -100,11 +463,18 @@ class GeminiClient:
         )
     
     def generate_text(self, prompt: str) -> Optional[str]:
-        """Generate text with retry logic"""
-        return self._make_request_with_retry(
+        """Generate text with retry logic, caching responses per prompt"""
+        cache_key = self._text_cache_key(prompt)
+        cached = self.text_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        result = self._make_request_with_retry(
             self._generate_text_request,
             prompt=prompt
         )
+        if result:
+            self.text_cache.set(cache_key, result)
+        return result
     
     def _make_request_with_retry(self, request_func, **kwargs):
         """Generic retry wrapper for API requests"""
@@ -123,154 +493,424 @@ class GeminiClient:
             "Content-Type": "application/json",
             "x-goog-api-key": self._get_current_api_key()
         }
+        data = self._image_request_body(prompt, sample_count, aspect_ratio)
         
-        data = {
-            "instances": [{"prompt": prompt}],
-            "parameters": {"sampleCount": sample_count, "aspectRatio": aspect_ratio}
-        }
+        body = json_utils.dumps(data, indent=False)
+        if ijson is None:
+            response = self.client.post(self.imagen_url, headers=headers, content=body, timeout=self.DEFAULT_TIMEOUT)
+            _raise_for_status(response)
+            return self._save_predictions(json_utils.loads(response.content), sample_count, filename)
         
-        response = requests.post(self.imagen_url, headers=headers, json=data, timeout=60)
-        response.raise_for_status()
-        result = response.json()
-        
-        # Process and save images
-        image_paths = []
-        for idx, img_obj in enumerate(result.get("predictions", [])):
-            image_data = img_obj.get("bytesBase64Encoded")
-            if image_data:
-                import base64
-                image_bytes = base64.b64decode(image_data)
-                
-                # Generate filename if not provided
-                if not filename:
-                    filename = f"generated_image_{int(time.time())}.png"
-                
-                out_name = filename if sample_count == 1 else f"{filename.rstrip('.png')}_{idx+1}.png"
-                image_path = os.path.join(os.path.dirname(__file__), 'assets', out_name)
-                
-                with open(image_path, "wb") as img_file:
-                    img_file.write(image_bytes)
-                
-                image_paths.append(image_path)
-        
-        return image_paths[0] if sample_count == 1 else image_paths
+        # Parse predictions incrementally so each base64 sample is decoded and dropped as it arrives
+        with self.client.stream("POST", self.imagen_url, headers=headers, content=body, timeout=self.DEFAULT_TIMEOUT) as response:
+            _raise_for_status(response)
+            writer = _PredictionWriter(sample_count, filename)
+            try:
+                for chunk in response.iter_bytes():
+                    writer.feed(chunk)
+                return writer.finish()
+            finally:
+                writer.close()
     
     def _generate_text_request(self, prompt: str) -> Optional[str]:
         """Make text generation request"""
         headers = {"Content-Type": "application/json"}
         params = {"key": self._get_current_api_key()}
+        data = self._text_request_body(prompt)
         
-        data = {
-            "contents": [{"parts": [{"text": prompt}]}]
-        }
-        
-        response = requests.post(self.text_url, headers=headers, params=params, json=data, timeout=30)
-        response.raise_for_status()
+        response = self.client.post(self.text_url, headers=headers, params=params, content=json_utils.dumps(data, indent=False), timeout=self.DEFAULT_TIMEOUT)
+        _raise_for_status(response)
+        return self._response_text(json_utils.loads(response.content))
+
+    def generate_texts(self, prompts: List[str]) -> List[Optional[str]]:
+        """
+        Generate text for several prompts, packing the uncached ones into a single Gemini request.
+        Falls back to one request per prompt if the batched reply can't be split into answers.
+        Batched answers are cached under their own keys, so generate_text never returns text
+        written under the batch instruction; single-prompt answers are reused here though.
+        Args:
+            prompts (List[str]): Prompts to answer.
+        Returns:
+            List[Optional[str]]: Answers in prompt order.
+        """
+        results = [
+            self.text_cache.get(self._text_cache_key(p)) or self.text_cache.get(self._batch_text_cache_key(p))
+            for p in prompts
+        ]
+        missing = [i for i, r in enumerate(results) if r is None]
+        if len(missing) > 1:
+            answers = self._make_request_with_retry(
+                self._generate_texts_request,
+                prompts=[prompts[i] for i in missing]
+            )
+            if answers is not None:
+                for i, answer in zip(missing, answers):
+                    results[i] = answer
+                    if answer:
+                        self.text_cache.set(self._batch_text_cache_key(prompts[i]), answer)
+                return results
+            logger.warning(f"Batched reply for {len(missing)} prompts could not be parsed, sending them one by one")
+        for i in missing:
+            results[i] = self.generate_text(prompts[i])
+        return results
+    
+    def _generate_texts_request(self, prompts: List[str]) -> Optional[List[str]]:
+        """Make one text generation request answering all prompts"""
+        params = {"key": self._get_current_api_key()}
+        data = self._batch_request_body(prompts)
         
-        result = response.json()
-        return result['candidates'][0]['content']['parts'][0]['text'].strip()
+        response = self.client.post(self.text_url, params=params, content=json_utils.dumps(data, indent=False), timeout=self.DEFAULT_TIMEOUT)
+        _raise_for_status(response)
+        return self._parse_batch_text(self._response_text(json_utils.loads(response.content)), len(prompts))
 
     def analyze_image_with_prompt(self, image_path: str, prompt: str) -> Optional[str]:
-        """Analyze image with Gemini using file upload and robust retry logic"""
-        return self._make_request_with_retry(
+        """Analyze image with Gemini using file upload and robust retry logic, caching results per image and prompt"""
+        image_digest = file_digest(image_path)
+        cache_key = self._analysis_cache_key(image_digest, prompt)
+        cached = self.analysis_cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"Using cached image analysis for {os.path.basename(image_path)}")
+            return cached
+        result = self._make_request_with_retry(
             self._analyze_image_with_prompt_request,
             image_path=image_path,
-            prompt=prompt
+            prompt=prompt,
+            image_digest=image_digest
         )
+        if result:
+            self.analysis_cache.set(cache_key, result)
+        return result
 
-    def _analyze_image_with_prompt_request(self, image_path: str, prompt: str) -> Optional[str]:
-        """Upload image, send prompt, and return Gemini's text response"""
-        file_uri = self._upload_image_to_gemini(image_path)
-        if not file_uri:
-            raise Exception("Failed to upload image to Gemini")
-        mime_type = self._get_mime_type(image_path)
+    def _analyze_image_with_prompt_request(self, image_path: str, prompt: str, image_digest: str) -> Optional[str]:
+        """Upload image (unless this content was uploaded recently), send prompt, and return Gemini's text response"""
+        api_key = self._get_current_api_key()
+        upload_key = self._upload_cache_key(image_digest, api_key)
+        file_uri = self.upload_cache.get(upload_key)
+        reused = file_uri is not None
+        if not reused:
+            file_uri = self._upload_image_to_gemini(image_path, api_key)
+            if not file_uri:
+                raise Exception("Failed to upload image to Gemini")
+            self.upload_cache.set(upload_key, file_uri)
         headers = {
-            "x-goog-api-key": self._get_current_api_key(),
+            "x-goog-api-key": api_key,
             "Content-Type": "application/json"
         }
-        data = {
-            "contents": [{
-                "parts": [
-                    {
-                        "file_data": {
-                            "mime_type": mime_type,
-                            "file_uri": file_uri
-                        }
-                    },
-                    {"text": prompt}
-                ]
-            }]
-        }
-        response = requests.post(self.image_url, headers=headers, json=data)
-        response.raise_for_status()
-        result = response.json()
-        return result['candidates'][0]['content']['parts'][0]['text'].strip()
+        data = self._analysis_request_body(image_path, file_uri, prompt)
+        response = self.client.post(self.image_url, headers=headers, content=json_utils.dumps(data, indent=False))
+        if reused and response.status_code in _STALE_FILE_STATUSES:
+            # The uploaded file was deleted or expired early; upload it again
+            self.upload_cache.delete(upload_key)
+            return self._analyze_image_with_prompt_request(image_path, prompt, image_digest)
+        _raise_for_status(response)
+        return self._response_text(json_utils.loads(response.content))
 
-    def _upload_image_to_gemini(self, image_path: str) -> Optional[str]:
-        """Upload image to Gemini and return file URI"""
+    def _upload_image_to_gemini(self, image_path: str, api_key: str) -> Optional[str]:
+        """Upload image to Gemini under api_key (uploaded files are only visible to that key) and return file URI"""
         try:
-            mime_type = self._get_mime_type(image_path)
-            num_bytes = os.path.getsize(image_path)
-            display_name = os.path.basename(image_path)
-            headers = {
-                "x-goog-api-key": self._get_current_api_key(),
-                "X-Goog-Upload-Protocol": "resumable",
-                "X-Goog-Upload-Command": "start",
-                "X-Goog-Upload-Header-Content-Length": str(num_bytes),
-                "X-Goog-Upload-Header-Content-Type": mime_type,
-                "Content-Type": "application/json"
-            }
-            data = {"file": {"display_name": display_name}}
-            response = requests.post(self.upload_url, headers=headers, json=data)
-            response.raise_for_status()
+            headers = self._upload_start_headers(image_path, api_key)
+            data = {"file": {"display_name": os.path.basename(image_path)}}
+            response = self.client.post(self.upload_url, headers=headers, content=json_utils.dumps(data, indent=False))
+            _raise_for_status(response)
             upload_url = response.headers.get("X-Goog-Upload-URL")
             if not upload_url:
                 raise Exception("No upload URL received")
-            with open(image_path, 'rb') as f:
-                file_data = f.read()
-            upload_headers = {
-                "x-goog-api-key": self._get_current_api_key(),
-                "Content-Length": str(num_bytes),
-                "X-Goog-Upload-Offset": "0",
-                "X-Goog-Upload-Command": "upload, finalize"
-            }
-            upload_response = requests.post(upload_url, headers=upload_headers, data=file_data)
-            upload_response.raise_for_status()
-            file_info = upload_response.json()
+            upload_headers = self._upload_finalize_headers(image_path, api_key)
+            # Stream the file in chunks instead of buffering the whole image
+            upload_response = self.client.post(upload_url, headers=upload_headers, content=_read_file_chunks(image_path))
+            _raise_for_status(upload_response)
+            file_info = json_utils.loads(upload_response.content)
             file_uri = file_info.get("file", {}).get("uri")
             return file_uri
         except Exception as e:
             logger.error(f"Error uploading image: {e}")
             return None
 
-    def _get_mime_type(self, image_path: str) -> str:
-        ext = os.path.splitext(image_path)[1].lower()
-        mime_types = {
-            '.jpg': 'image/jpeg',
-            '.jpeg': 'image/jpeg',
-            '.png': 'image/png',
-            '.gif': 'image/gif',
-            '.webp': 'image/webp'
-        }
-        return mime_types.get(ext, 'image/jpeg')
-
     def generate_culture_details(self, culture: str) -> str:
         """Generate a detailed, visually descriptive paragraph about a culture's textile motifs, symbols, colors, and techniques using Gemini."""
-        prompt = (
-            f"For the {culture.title()} culture, provide:\n"
-            "- 3 to 5 of the most iconic textile motifs or symbols (with names and meanings if possible)\n"
-            "- The traditional color palette (with color names or hex codes)\n"
-            "- The typical arrangement style of motifs (e.g., rows, bands, all-over, grid)\n"
-            "- Notable textile techniques or materials\n"
-            "- One or two 'do's and don'ts' for authentic design\n"
-            "Return your answer as a concise, richly descriptive paragraph."
+        try:
+            return self._culture_details_memo(culture.strip().lower())
+        except Exception as e:
+            logger.error(f"Error generating culture details for {culture}: {e}")
+            return ""
+
+    def _fetch_culture_details(self, culture_key: str) -> str:
+        """Request culture details, raising on an empty reply so it isn't memoized."""
+        details = self.generate_text(self._culture_details_prompt(culture_key))
+        if not details:
+            raise ValueError("Empty culture details response")
+        return details.strip()
+
+    def generate_culture_details_batch(self, cultures: List[str]) -> List[str]:
+        """
+        Generate culture details for several cultures in one Gemini request. Repeat batches are
+        served from the text cache; single generate_culture_details calls still ask for their own answer.
+        Args:
+            cultures (List[str]): Cultures to describe.
+        Returns:
+            List[str]: Details paragraph per culture ("" where generation failed).
+        """
+        try:
+            details = self.generate_texts([self._culture_details_prompt(c) for c in cultures])
+            return [d.strip() if d else "" for d in details]
+        except Exception as e:
+            logger.error(f"Error generating culture details for {', '.join(cultures)}: {e}")
+            return [""] * len(cultures)
+
+class AsyncGeminiClient(_GeminiClientBase):
+    """
+    asyncio counterpart of GeminiClient built on an HTTP/2 httpx.AsyncClient, so batched
+    calls overlap their network round-trips instead of running one after another.
+
+    The underlying connection pool is bound to the running event loop; use as
+    `async with AsyncGeminiClient() as client:` or call `aclose()` when done.
+    """
+    def __init__(self) -> None:
+        super().__init__()
+        self.client = httpx.AsyncClient(
+            transport=_AsyncBreakerTransport(
+                httpx.AsyncHTTPTransport(
+                    http2=True,
+                    limits=httpx.Limits(max_connections=32, max_keepalive_connections=16)
+                ),
+                self.breaker
+            ),
+            timeout=self.DEFAULT_TIMEOUT,
+            headers={"Content-Type": "application/json"}
+        )
+        # Caps in-flight requests so large gathers back off locally instead of tripping 429s
+        self._request_slots = asyncio.Semaphore(int(os.getenv('GEMINI_MAX_CONCURRENCY', 8)))
+    
+    async def __aenter__(self) -> "AsyncGeminiClient":
+        return self
+    
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+    
+    async def aclose(self) -> None:
+        """Close the pooled HTTP/2 connections and the cache databases"""
+        await self.client.aclose()
+        self._close_caches()
+    
+    async def _make_request_with_retry(self, request_func, **kwargs):
+        """Generic retry wrapper for API request coroutines; waits without blocking the event loop"""
+        for retry_count in range(self.max_retries + 1):
+            try:
+                # The slot is held per attempt, never across the backoff sleep
+                async with self._request_slots:
+                    return await request_func(**kwargs)
+            except Exception as e:
+                delay = self._retry_delay(e, retry_count, self.max_retries)
+                if delay is None:
+                    raise e
+                await asyncio.sleep(delay)
+        
+        raise Exception(f"Failed after {self.max_retries} retry attempts")
+    
+    async def generate_image(self, prompt: str, sample_count: int = 4, filename: Optional[str] = None, aspect_ratio: str = "1:1") -> Optional[List[str]]:
+        """Generate image with retry logic"""
+        return await self._make_request_with_retry(
+            self._generate_image_request,
+            prompt=prompt,
+            sample_count=sample_count,
+            filename=filename,
+            aspect_ratio=aspect_ratio
+        )
+    
+    async def generate_text(self, prompt: str) -> Optional[str]:
+        """Generate text with retry logic, caching responses per prompt"""
+        cache_key = self._text_cache_key(prompt)
+        cached = self.text_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        result = await self._make_request_with_retry(
+            self._generate_text_request,
+            prompt=prompt
+        )
+        if result:
+            self.text_cache.set(cache_key, result)
+        return result
+    
+    async def generate_many(self, prompts: List[str]) -> List[Optional[str]]:
+        """Generate text for several prompts concurrently, returning results in prompt order"""
+        return await asyncio.gather(*(self.generate_text(p) for p in prompts))
+    
+    async def _generate_image_request(self, prompt: str, sample_count: int = 1, filename: Optional[str] = None, aspect_ratio: str = "1:1") -> Optional[List[str]]:
+        """Make image generation request"""
+        headers = {"x-goog-api-key": self._get_current_api_key()}
+        data = self._image_request_body(prompt, sample_count, aspect_ratio)
+        
+        body = json_utils.dumps(data, indent=False)
+        if ijson is None:
+            response = await self.client.post(self.imagen_url, headers=headers, content=body)
+            _raise_for_status(response)
+            # Decoding and writing the images is blocking work; keep it off the event loop
+            return await asyncio.to_thread(self._save_predictions, json_utils.loads(response.content), sample_count, filename)
+        
+        async with self.client.stream("POST", self.imagen_url, headers=headers, content=body) as response:
+            _raise_for_status(response)
+            writer = _PredictionWriter(sample_count, filename)
+            try:
+                async for chunk in response.aiter_bytes():
+                    writer.feed(chunk)
+                return await asyncio.to_thread(writer.finish)
+            finally:
+                writer.close()
+    
+    async def _generate_text_request(self, prompt: str) -> Optional[str]:
+        """Make text generation request"""
+        params = {"key": self._get_current_api_key()}
+        data = self._text_request_body(prompt)
+        
+        response = await self.client.post(self.text_url, params=params, content=json_utils.dumps(data, indent=False), timeout=self.DEFAULT_TIMEOUT)
+        _raise_for_status(response)
+        return self._response_text(json_utils.loads(response.content))
+    
+    async def analyze_image_with_prompt(self, image_path: str, prompt: str) -> Optional[str]:
+        """Analyze image with Gemini using file upload and robust retry logic, caching results per image and prompt"""
+        image_digest = await asyncio.to_thread(file_digest, image_path)
+        cache_key = self._analysis_cache_key(image_digest, prompt)
+        cached = self.analysis_cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"Using cached image analysis for {os.path.basename(image_path)}")
+            return cached
+        result = await self._make_request_with_retry(
+            self._analyze_image_with_prompt_request,
+            image_path=image_path,
+            prompt=prompt,
+            image_digest=image_digest
         )
+        if result:
+            self.analysis_cache.set(cache_key, result)
+        return result
+    
+    async def _analyze_image_with_prompt_request(self, image_path: str, prompt: str, image_digest: str) -> Optional[str]:
+        """Upload image (unless this content was uploaded recently), send prompt, and return Gemini's text response"""
+        api_key = self._get_current_api_key()
+        upload_key = self._upload_cache_key(image_digest, api_key)
+        file_uri = self.upload_cache.get(upload_key)
+        reused = file_uri is not None
+        if not reused:
+            file_uri = await self._upload_image_to_gemini(image_path, api_key)
+            if not file_uri:
+                raise Exception("Failed to upload image to Gemini")
+            self.upload_cache.set(upload_key, file_uri)
+        headers = {"x-goog-api-key": api_key}
+        data = self._analysis_request_body(image_path, file_uri, prompt)
+        response = await self.client.post(self.image_url, headers=headers, content=json_utils.dumps(data, indent=False))
+        if reused and response.status_code in _STALE_FILE_STATUSES:
+            # The uploaded file was deleted or expired early; upload it again
+            self.upload_cache.delete(upload_key)
+            return await self._analyze_image_with_prompt_request(image_path, prompt, image_digest)
+        _raise_for_status(response)
+        return self._response_text(json_utils.loads(response.content))
+    
+    async def _upload_image_to_gemini(self, image_path: str, api_key: str) -> Optional[str]:
+        """Upload image to Gemini under api_key (uploaded files are only visible to that key) and return file URI"""
+        try:
+            headers = self._upload_start_headers(image_path, api_key)
+            data = {"file": {"display_name": os.path.basename(image_path)}}
+            response = await self.client.post(self.upload_url, headers=headers, content=json_utils.dumps(data, indent=False))
+            _raise_for_status(response)
+            upload_url = response.headers.get("X-Goog-Upload-URL")
+            if not upload_url:
+                raise Exception("No upload URL received")
+            upload_headers = self._upload_finalize_headers(image_path, api_key)
+            upload_response = await self.client.post(upload_url, headers=upload_headers, content=_iter_file_chunks(image_path))
+            _raise_for_status(upload_response)
+            file_info = json_utils.loads(upload_response.content)
+            return file_info.get("file", {}).get("uri")
+        except Exception as e:
+            logger.error(f"Error uploading image: {e}")
+            return None
+    
+    async def generate_culture_details(self, culture: str) -> str:
+        """Generate a detailed, visually descriptive paragraph about a culture's textile motifs, symbols, colors, and techniques using Gemini."""
         try:
-            details = self.generate_text(prompt)
+            details = await self.generate_text(self._culture_details_prompt(culture))
             return details.strip() if details else ""
         except Exception as e:
             logger.error(f"Error generating culture details for {culture}: {e}")
             return ""
 
-# Global client instance
-gemini_client = GeminiClient() 
\ No newline at end of file
+class _PredictionWriter:
+    """Decodes and writes Imagen samples on a thread pool as prediction objects arrive."""
+    def __init__(self, sample_count: int, filename: Optional[str]) -> None:
+        # Generate filename if not provided
+        self.filename = filename or f"generated_image_{int(time.time())}.png"
+        # Relative names land in assets/; an absolute path writes straight to its own directory
+        path = _ASSETS_DIR / self.filename
+        self.out_dir = path.parent
+        self.name = path.name
+        self.stem = path.stem
+        self.sample_count = sample_count
+        self._pool = ThreadPoolExecutor(max_workers=min(8, max(1, sample_count)))
+        self._futures = []
+        self._next_idx = 0
+        self._items = None
+        self._parser = None
+    
+    def _write(self, idx: int, image_data: str) -> str:
+        out_name = self.name if self.sample_count == 1 else f"{self.stem}_{idx+1}.png"
+        image_path = self.out_dir / out_name
+        image_path.write_bytes(base64.b64decode(image_data))
+        return str(image_path)
+    
+    def add(self, img_obj: Dict[str, Any]) -> None:
+        """Queue one prediction object for decoding"""
+        idx = self._next_idx
+        self._next_idx += 1
+        image_data = img_obj.get("bytesBase64Encoded")
+        if image_data:
+            self._futures.append(self._pool.submit(self._write, idx, image_data))
+    
+    def feed(self, chunk: bytes) -> None:
+        """Feed raw response bytes; complete prediction objects are queued as soon as they parse"""
+        if self._parser is None:
+            self._items = ijson.sendable_list()
+            self._parser = ijson.items_coro(self._items, 'predictions.item')
+        self._parser.send(chunk)
+        self._drain()
+    
+    def _drain(self) -> None:
+        for img_obj in self._items:
+            self.add(img_obj)
+        del self._items[:]
+    
+    def finish(self):
+        """Wait for every queued sample and return the saved path(s)"""
+        if self._parser is not None:
+            self._parser.close()
+            self._drain()
+        image_paths = [future.result() for future in self._futures]
+        return image_paths[0] if self.sample_count == 1 else image_paths
+    
+    def close(self) -> None:
+        self._pool.shutdown(wait=False)
+
+def _read_file_chunks(path: str, chunk_size: int = 1 << 20) -> Iterator[bytes]:
+    """Yield a file's contents in chunks"""
+    with open(path, 'rb') as f:
+        yield from iter(lambda: f.read(chunk_size), b'')
+
+async def _iter_file_chunks(path: str, chunk_size: int = 1 << 20) -> AsyncIterator[bytes]:
+    """Yield a file's contents in chunks, reading off the event loop"""
+    with open(path, 'rb') as f:
+        while True:
+            chunk = await asyncio.to_thread(f.read, chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+@functools.lru_cache(maxsize=1)
+def get_client() -> GeminiClient:
+    """Return the shared GeminiClient, creating it (and reading .env) on first use."""
+    client = GeminiClient()
+    atexit.register(client.close)
+    return client
+
+def __getattr__(name: str) -> Any:
+    # Keeps `from gemini_client import gemini_client` working without building the client at import
+    if name == 'gemini_client':
+        return get_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,17 +1,50 @@
-from gemini_client import gemini_client
+import functools
+from gemini_client import get_client
+from _cache import FailureCache
+
+# Cultures whose note request just failed; answered with the placeholder for a minute
+_note_failures = FailureCache(ttl=60)
 
 PROMPT_TEMPLATE = (
     "Provide a short, respectful cultural note (2-3 sentences) about the {culture} culture, "
     "focusing on its visual art, patterns, or symbolism. The note should be suitable for designers using generated assets."
 )
 
+@functools.lru_cache(maxsize=256)
+def _cached_note(culture_key):
+    """Fetch the note for a normalized culture name; errors and empty replies raise so they aren't cached"""
+    # Use the robust client with retry logic
+    note = get_client().generate_text(PROMPT_TEMPLATE.format(culture=culture_key.title()))
+    if not note:
+        raise ValueError("Empty cultural note response")
+    return note
+
 def generate_cultural_note(culture):
     """Generate cultural note using the robust Gemini client with retry logic"""
-    prompt = PROMPT_TEMPLATE.format(culture=culture.title())
+    culture_key = culture.strip().lower()
+    if _note_failures.recently_failed(culture_key):
+        return f"[Gemini API error: recent request failed] Placeholder note for {culture.title()}."
+    
+    try:
+        note = _cached_note(culture_key)
+        _note_failures.clear(culture_key)
+        return note
+    except Exception as e:
+        _note_failures.record(culture_key)
+        return f"[Gemini API error: {e}] Placeholder note for {culture.title()}."
+
+async def generate_cultural_note_async(client, culture):
+    """Async version of generate_cultural_note, awaited on an open AsyncGeminiClient"""
+    culture_key = culture.strip().lower()
+    if _note_failures.recently_failed(culture_key):
+        return f"[Gemini API error: recent request failed] Placeholder note for {culture.title()}."
     
     try:
-        # Use the robust client with retry logic
-        note = gemini_client.generate_text(prompt)
+        note = await client.generate_text(PROMPT_TEMPLATE.format(culture=culture_key.title()))
+        if not note:
+            raise ValueError("Empty cultural note response")
+        _note_failures.clear(culture_key)
         return note
     except Exception as e:
-        return f"[Gemini API error: {e}] Placeholder note for {culture.title()}." 
\ No newline at end of file
+        _note_failures.record(culture_key)
+        return f"[Gemini API error: {e}] Placeholder note for {culture.title()}."
@@ -3,16 +3,57 @@ imagegen_gemini.py - Pattern image generation using Gemini with robust prompt en
 """
 import os
 import logging
+from pathlib import Path
 from typing import Optional, List, Union
-from gemini_client import gemini_client
+from gemini_client import get_client, AsyncGeminiClient
+from _cache import FailureCache
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
 # Directory to save generated images
-ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets')
+ASSETS_DIR = str(Path(__file__).resolve().parent / 'assets')
 os.makedirs(ASSETS_DIR, exist_ok=True)
 
+# Cultures whose details lookup just failed; skipped for a minute so outages don't trigger retry storms
+_details_failures = FailureCache(ttl=60)
+
+# Fixed instruction block shared by every pattern request; only culture and details vary
+PATTERN_PROMPT_TEMPLATE = (
+    "Generate a seamless {culture} textile pattern. "
+    "Include the most iconic motifs, symbols, and artistic elements associated with {culture} culture. {details} "
+    "Use a color palette that is traditional for this culture. "
+    "Arrange motifs in a style typical of this culture's textiles (e.g., rows, bands, grids, or all-over). "
+    "Reference traditional techniques (e.g., weaving, resist-dyeing, embroidery) if relevant. "
+    "The design must fill the entire square canvas, with no borders, white space, or empty areas at the edges. "
+    "Do not include any text, watermarks, signatures, or logos. "
+    "The pattern should be highly detailed, vibrant, and culturally authentic, with consistent spacing and no blank or plain areas. "
+    "Avoid modern or anachronistic elements; reference real artifacts or museum pieces where possible. "
+    "The style should be professional, visually balanced, museum-quality, and suitable for use in high-end design applications. "
+    "Create the pattern as if by a professional textile designer."
+)
+
+def _build_pattern_prompt(culture: str, details: str) -> str:
+    """Build the high-detail Imagen prompt for a culture's seamless textile pattern."""
+    return PATTERN_PROMPT_TEMPLATE.format(culture=culture.title(), details=details)
+
+def _record_details_result(culture_key: str, details: str) -> None:
+    """Track whether a details lookup failed (generate_culture_details returns "" on error)."""
+    if details:
+        _details_failures.clear(culture_key)
+    else:
+        logger.warning(f"No culture details for {culture_key}; using the base prompt for the next minute")
+        _details_failures.record(culture_key)
+
+def _get_details(culture: str) -> str:
+    """Fetch culture details, or "" without calling the API if the lookup failed recently."""
+    culture_key = culture.lower()
+    if _details_failures.recently_failed(culture_key):
+        return ""
+    details = get_client().generate_culture_details(culture)
+    _record_details_result(culture_key, details)
+    return details
+
 def generate_pattern_image(
     culture: str,
     filename: Optional[str] = None,
@@ -24,7 +65,44 @@ def generate_pattern_image(
 
     Args:
         culture (str): The culture to generate the pattern for.
-        filename (Optional[str]): Optional filename for the generated image(s).
+        filename (Optional[str]): Optional filename for the generated image(s), relative to assets/ or an absolute path.
+        sample_count (int): Number of images to generate (default: 4).
+        aspect_ratio (str): Aspect ratio for generated images (default: "1:1").
+
+    Returns:
+        Optional[Union[str, List[str]]]: Path(s) to the generated image(s), or None if generation fails.
+    """
+    # Always use dynamic AI-generated details; the client caches them per prompt
+    details = _get_details(culture)
+    prompt = _build_pattern_prompt(culture, details)
+    if not filename:
+        filename = f"{culture.title()}_pattern_imagen4.png"
+    try:
+        result = get_client().generate_image(
+            prompt=prompt,
+            sample_count=sample_count,
+            filename=filename,
+            aspect_ratio=aspect_ratio
+        )
+        return result
+    except Exception as e:
+        logger.error(f"[Imagen 4 API error: {e}]")
+        return None
+
+async def generate_pattern_image_async(
+    client: AsyncGeminiClient,
+    culture: str,
+    filename: Optional[str] = None,
+    sample_count: int = 4,
+    aspect_ratio: str = "1:1"
+) -> Optional[Union[str, List[str]]]:
+    """
+    Async version of generate_pattern_image, so several cultures can be generated together with asyncio.gather.
+
+    Args:
+        client (AsyncGeminiClient): Open async client to issue the requests on.
+        culture (str): The culture to generate the pattern for.
+        filename (Optional[str]): Optional filename for the generated image(s), relative to assets/ or an absolute path.
         sample_count (int): Number of images to generate (default: 4).
         aspect_ratio (str): Aspect ratio for generated images (default: "1:1").
 
@@ -32,39 +110,21 @@ def generate_pattern_image(
         Optional[Union[str, List[str]]]: Path(s) to the generated image(s), or None if generation fails.
     """
     culture_key = culture.lower()
-    # Always use dynamic AI-generated details, with cache
-    if not hasattr(generate_pattern_image, '_dynamic_culture_details_cache'):
-        generate_pattern_image._dynamic_culture_details_cache = {}
-    cache = generate_pattern_image._dynamic_culture_details_cache
-    if culture_key in cache:
-        details = cache[culture_key]
+    if _details_failures.recently_failed(culture_key):
+        details = ""
     else:
-        details = gemini_client.generate_culture_details(culture)
-        cache[culture_key] = details
-    # Further tuned, explicit, high-detail prompt template
-    prompt = (
-        f"Generate a seamless {culture.title()} textile pattern. "
-        f"Include the most iconic motifs, symbols, and artistic elements associated with {culture.title()} culture. {details} "
-        "Use a color palette that is traditional for this culture. "
-        "Arrange motifs in a style typical of this culture's textiles (e.g., rows, bands, grids, or all-over). "
-        "Reference traditional techniques (e.g., weaving, resist-dyeing, embroidery) if relevant. "
-        "The design must fill the entire square canvas, with no borders, white space, or empty areas at the edges. "
-        "Do not include any text, watermarks, signatures, or logos. "
-        "The pattern should be highly detailed, vibrant, and culturally authentic, with consistent spacing and no blank or plain areas. "
-        "Avoid modern or anachronistic elements; reference real artifacts or museum pieces where possible. "
-        "The style should be professional, visually balanced, museum-quality, and suitable for use in high-end design applications. "
-        "Create the pattern as if by a professional textile designer."
-    )
+        details = await client.generate_culture_details(culture)
+        _record_details_result(culture_key, details)
+    prompt = _build_pattern_prompt(culture, details)
     if not filename:
         filename = f"{culture.title()}_pattern_imagen4.png"
     try:
-        result = gemini_client.generate_image(
+        return await client.generate_image(
             prompt=prompt,
             sample_count=sample_count,
             filename=filename,
             aspect_ratio=aspect_ratio
         )
-        return result
     except Exception as e:
         logger.error(f"[Imagen 4 API error: {e}]")
-        return None 
\ No newline at end of file
+        return None
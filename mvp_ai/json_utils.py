@@ -0,0 +1,47 @@
+"""
+json_utils.py - JSON encoding/decoding helpers for HeritageAI, using orjson when available.
+"""
+import json
+import datetime
+from typing import Any, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def _default(obj: Any) -> Any:
+    """Serialize datetimes as ISO 8601 in the stdlib fallback, matching orjson's native output."""
+    if isinstance(obj, (datetime.date, datetime.time)):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def dumps(obj: Any, indent: bool = True) -> bytes:
+    """
+    Serialize obj to UTF-8 JSON bytes. datetime values are written as ISO 8601 strings.
+    Args:
+        obj (Any): Data to serialize.
+        indent (bool): Pretty-print with two-space indentation (default: True).
+    Returns:
+        bytes: Encoded JSON.
+    """
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(obj, option=option)
+    return json.dumps(obj, indent=2 if indent else None, ensure_ascii=False, default=_default).encode('utf-8')
+
+def loads(data: Union[bytes, str]) -> Any:
+    """Deserialize JSON from bytes or str."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def dump(obj: Any, path: str, indent: bool = True) -> None:
+    """Serialize obj as JSON and write it to path."""
+    with open(path, 'wb') as f:
+        f.write(dumps(obj, indent))
+
+def load(path: str) -> Any:
+    """Read and deserialize the JSON file at path."""
+    with open(path, 'rb') as f:
+        return loads(f.read())
@@ -4,17 +4,25 @@ main.py - HeritageAI CLI and orchestration module
 Provides command-line tools for generating, analyzing, and exporting culturally-inspired design assets using AI models.
 """
 import os
+import re
+import random
+import asyncio
+import functools
 import argparse
-import json
 import logging
 import datetime
-from typing import Any, Dict, Optional
-from clip_model import generate_pattern_and_palette, score_image_with_prompt
-from gemini_notes import generate_cultural_note
-from imagegen_gemini import generate_pattern_image
-from color_palette import extract_palette
-from export_formats import export_kit_formats
-from ai_culture_generator import ai_culture_generator
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
+from color_palette import extract_palette, load_or_extract_palette
+from _cache import text_digest
+import json_utils
+
+# CLIP/torch, the Gemini clients and the exporters are imported inside the commands that use
+# them, so e.g. `palette` or `bundle` never pay for loading them
+if TYPE_CHECKING:
+    from gemini_client import AsyncGeminiClient
+
+T = TypeVar("T")
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
@@ -23,19 +31,219 @@ logger = logging.getLogger(__name__)
 # Default cultures for examples, but any culture can be used
 DEFAULT_CULTURES = ['yoruba', 'edo', 'maori']
 ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets')
+# A culture's directory key: word characters (any script) and '-', no leading '_', dot or separator
+_CULTURE_SLUG_RE = re.compile(r'[^\W_][\w-]{0,63}')
+# Images per CLIP forward pass when scoring the assets directory
+CLIP_BATCH_SIZE = 32
+# Pattern generations issued per design kit
+PATTERN_VARIANTS = 3
+# Threads used to extract palettes from freshly generated images
+PALETTE_WORKERS = 4
+# Threads used by cli_bundle to read and write bundle files
+BUNDLE_WORKERS = 16
+# Whole-step retries for generate-kit's Gemini calls, on top of the client's per-request retries
+KIT_STEP_ATTEMPTS = 3
+KIT_STEP_RETRY_BASE = 0.5
+KIT_STEP_RETRY_CAP = 8.0
+# Per-kit index of finished generations, so reruns reuse patterns instead of regenerating them;
+# a dotfile like the web manifest, so it stays out of downloaded kit archives
+GENERATIONS_INDEX = ".generations.json"
+# Start of the placeholder generate_cultural_note returns when Gemini fails
+NOTE_ERROR_PREFIX = "[Gemini API error"
+
+def culture_slug(culture: str) -> Optional[str]:
+    """
+    Return the key naming a culture's kit directory: case-folded, with whitespace runs joined
+    by '_', so "Yoruba" and "yoruba " share one kit. The culture name itself is left as given
+    for prompts and labels. Returns None for names that can't safely name a directory
+    (path separators, dots, control characters, more than 64 characters).
+    """
+    slug = '_'.join(culture.casefold().split())
+    return slug if _CULTURE_SLUG_RE.fullmatch(slug) else None
+
+def culture_kit_dir(culture: str) -> str:
+    """Directory a culture's design kit lives in, shared by the CLI and the web API."""
+    slug = culture_slug(culture)
+    if slug is None:
+        raise ValueError(f"Invalid culture name: {culture!r}")
+    return os.path.join(ASSETS_DIR, f"{slug}_kit")
+
+def _iter_png_assets() -> Iterator[os.DirEntry]:
+    """Yield PNG files in the assets directory lazily from a single scandir pass (no per-file stat)."""
+    with os.scandir(ASSETS_DIR) as it:
+        for entry in it:
+            if entry.name.endswith('.png') and entry.is_file(follow_symlinks=False):
+                yield entry
+
+def _generation_key(culture: str, clip_prompt: str, variant: int, aspect_ratio: str, sample_count: int) -> str:
+    """Identify one pattern generation by everything that determines its output."""
+    return text_digest(f"{culture}|{clip_prompt}|{variant}|{aspect_ratio}|{sample_count}")
+
+def _load_generations(kit_dir: str) -> Dict[str, List[str]]:
+    """Read the kit's generation index (generation key -> image file names); missing or corrupt reads as empty."""
+    try:
+        return json_utils.load(os.path.join(kit_dir, GENERATIONS_INDEX))
+    except (OSError, ValueError):
+        return {}
+
+async def _with_retry(
+    call: Callable[[], Awaitable[T]], what: str,
+    attempts: int = KIT_STEP_ATTEMPTS, base: float = KIT_STEP_RETRY_BASE, cap: float = KIT_STEP_RETRY_CAP
+) -> Optional[T]:
+    """
+    Await call() until it returns a truthy result, sleeping with full-jitter exponential
+    backoff between attempts. The Gemini helpers log and return None/"" on failure rather
+    than raise, so an empty result counts as a failure just like an exception.
+    Returns:
+        Optional[T]: The first successful result, or the last (empty) result / None.
+    """
+    result = None
+    for attempt in range(attempts):
+        try:
+            result = await call()
+        except Exception as e:
+            logger.error(f"Error fetching {what}: {e}")
+            result = None
+        if result:
+            return result
+        if attempt + 1 < attempts:
+            delay = random.uniform(0, min(cap, base * 2 ** attempt))
+            logger.warning(f"Retrying {what} in {delay:.1f}s (attempt {attempt + 2}/{attempts})...")
+            await asyncio.sleep(delay)
+    return result
+
+async def _generate_pattern_assets(
+    client: "AsyncGeminiClient", culture: str, kit_dir: str, count: int, clip_prompt: str,
+    regenerate: bool = False
+) -> Tuple[List[str], List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Generate count pattern variants concurrently, straight into kit_dir, and pipeline the per-image work behind them.
+    A variant whose generation key is already in the kit's .generations.json, with all its
+    files still present, is reused instead of generated again (unless regenerate is set).
+    As each generation lands, its images are queued for palette extraction (thread pool) and
+    for one batched CLIP pass (single worker, so the model is never entered concurrently),
+    overlapping the remaining network calls with compute. Rate limits and transient errors
+    are retried inside the client; a generation that still fails is retried whole by _with_retry.
+    Returns:
+        Tuple: pattern paths, palettes and per-pattern CLIP metadata, in generation order.
+    """
+    from imagegen_gemini import generate_pattern_image_async
+    loop = asyncio.get_running_loop()
+
+    sample_count, aspect_ratio = 4, "1:1"
+    generations = {} if regenerate else _load_generations(kit_dir)
+    generations_changed = False
+
+    async def generate(i: int) -> Tuple[int, Any]:
+        nonlocal generations_changed
+        key = _generation_key(culture, clip_prompt, i, aspect_ratio, sample_count)
+        cached = [os.path.join(kit_dir, name) for name in generations.get(key, [])]
+        if cached and all(os.path.exists(path) for path in cached):
+            logger.info(f"  Reusing pattern {i+1} from an earlier run")
+            return i, cached
+        image_result = await _with_retry(
+            lambda: generate_pattern_image_async(
+                client, culture, filename=os.path.join(kit_dir, f"{culture}_pattern_{i+1}.png"),
+                sample_count=sample_count, aspect_ratio=aspect_ratio
+            ),
+            f"pattern {i+1}"
+        )
+        if image_result:
+            image_paths = image_result if isinstance(image_result, list) else [image_result]
+            generations[key] = [os.path.basename(path) for path in image_paths]
+            generations_changed = True
+        return i, image_result
+
+    generated: Dict[int, List[str]] = {}
+    palette_jobs: Dict[Tuple[int, int], "asyncio.Future"] = {}
+    score_jobs: Dict[int, "asyncio.Future"] = {}
+    patterns: List[str] = []
+    palettes: List[Dict[str, Any]] = []
+    pattern_metadata: List[Dict[str, Any]] = []
+    with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as palette_pool, \
+            ThreadPoolExecutor(max_workers=1) as clip_pool:
+        for next_done in asyncio.as_completed([generate(i) for i in range(count)]):
+            i, image_result = await next_done
+            if not image_result:
+                continue
+            image_paths = image_result if isinstance(image_result, list) else [image_result]
+            generated[i] = image_paths
+            for idx, pattern_path in enumerate(image_paths):
+                palette_jobs[(i, idx)] = loop.run_in_executor(palette_pool, load_or_extract_palette, pattern_path)
+            score_jobs[i] = loop.run_in_executor(clip_pool, _clip_scores, image_paths, clip_prompt)
+        # Assemble in generation order, whatever order the work finished in
+        for i in sorted(generated):
+            image_paths = generated[i]
+            try:
+                clip_scores = await score_jobs[i]
+            except Exception as e:
+                logger.error(f"Error scoring with CLIP: {e}")
+                clip_scores = [None] * len(image_paths)
+            for idx, (pattern_path, clip_score) in enumerate(zip(image_paths, clip_scores)):
+                patterns.append(pattern_path)
+                try:
+                    palette_colors, _ = await palette_jobs[(i, idx)]
+                    palettes.append({
+                        "colors": palette_colors,
+                        "source_image": os.path.basename(pattern_path),
+                        "note": f"Color palette extracted from {culture} pattern {idx+1}"
+                    })
+                except Exception as e:
+                    logger.error(f"Error extracting palette: {e}")
+                if clip_score is not None:
+                    logger.info(f"CLIP score: {clip_score:.3f} for {os.path.basename(pattern_path)}")
+                pattern_metadata.append({
+                    "image": os.path.basename(pattern_path),
+                    "clip_score": clip_score,
+                    "clip_prompt": clip_prompt
+                })
+    if generations_changed:
+        json_utils.dump(generations, os.path.join(kit_dir, GENERATIONS_INDEX))
+    return patterns, palettes, pattern_metadata
+
+def _clip_scores(image_paths: List[str], prompt: str) -> List[Optional[float]]:
+    """
+    Score images against one prompt with CLIP, CLIP_BATCH_SIZE images per forward pass.
+    The prompt is encoded once; a failing batch is retried image by image so one bad
+    file only loses its own score (None).
+    """
+    if not image_paths:
+        return []
+    from clip_model import encode_text, score_images_against_text_emb, score_image_against_text_emb
+    # Encode the prompt once and reuse the embedding for every image
+    text_emb = encode_text(prompt)
+    scores: List[Optional[float]] = []
+    for start in range(0, len(image_paths), CLIP_BATCH_SIZE):
+        batch = image_paths[start:start + CLIP_BATCH_SIZE]
+        try:
+            # Similarities come back as one vectorized matmul; tolist converts them in C
+            scores.extend(score_images_against_text_emb(batch, text_emb).tolist())
+        except Exception as e:
+            # Score one by one so a single unreadable file doesn't hide the rest of the batch
+            logger.warning(f"Batch scoring failed ({e}); scoring images individually")
+            for path in batch:
+                try:
+                    scores.append(score_image_against_text_emb(path, text_emb))
+                except Exception as e:
+                    logger.error(f"{os.path.basename(path)}: error scoring image: {e}")
+                    scores.append(None)
+    return scores
 
 def cli_generate(args: argparse.Namespace) -> None:
     """Generate pattern images and color palettes for a culture."""
     culture: str = args.culture
     sample_count: int = args.count
     aspect_ratio: str = args.aspect_ratio
+    from imagegen_gemini import generate_pattern_image
     logger.info(f"Generating {sample_count} pattern image(s) for {culture.title()} with aspect ratio {aspect_ratio}...")
     image_result = generate_pattern_image(culture, sample_count=sample_count, aspect_ratio=aspect_ratio)
     if image_result:
         image_paths = [image_result] if isinstance(image_result, str) else image_result
-        for idx, image_path in enumerate(image_paths, 1):
+        # Extract every palette in parallel, then log in image order
+        with ThreadPoolExecutor(max_workers=min(PALETTE_WORKERS, len(image_paths))) as pool:
+            results = list(pool.map(load_or_extract_palette, image_paths))
+        for idx, (image_path, (palette, palette_json)) in enumerate(zip(image_paths, results), 1):
             logger.info(f"Pattern image {idx} generated and saved to: {image_path}")
-            palette, palette_json = extract_palette(image_path)
             logger.info(f"Extracted color palette: {palette}")
             logger.info(f"Palette JSON saved to: {palette_json}")
     else:
@@ -44,130 +252,140 @@ def cli_generate(args: argparse.Namespace) -> None:
 def cli_palette(args: argparse.Namespace) -> None:
     """Extract color palettes for all PNG images in the assets directory."""
     logger.info("Extracting palettes for all PNG images in assets/...")
-    for fname in os.listdir(ASSETS_DIR):
-        if fname.endswith('.png'):
-            img_path = os.path.join(ASSETS_DIR, fname)
-            palette, palette_json = extract_palette(img_path)
-            logger.info(f"{fname}: {palette} (saved to {palette_json})")
+    for entry in _iter_png_assets():
+        palette, palette_json = extract_palette(entry.path)
+        logger.info(f"{entry.name}: {palette} (saved to {palette_json})")
+
+def _note_is_current(note_path: str) -> bool:
+    """True if note_path holds a real note from an earlier run (not a placeholder left by an API error)."""
+    try:
+        with open(note_path, encoding='utf-8') as f:
+            return not f.read(len(NOTE_ERROR_PREFIX)).startswith(NOTE_ERROR_PREFIX)
+    except FileNotFoundError:
+        return False
 
 def cli_brief(args: argparse.Namespace) -> None:
     """Generate cultural notes for all PNG images in the assets directory."""
     logger.info("Generating cultural notes for all PNG images in assets/...")
-    for fname in os.listdir(ASSETS_DIR):
-        if fname.endswith('.png'):
-            culture = fname.split('_')[0]
-            note = generate_cultural_note(culture)
-            note_path = os.path.join(ASSETS_DIR, f"{culture}_note.txt")
-            with open(note_path, 'w', encoding='utf-8') as f:
-                f.write(note)
-            logger.info(f"{fname}: note saved to {note_path}")
+    from gemini_notes import generate_cultural_note
+    # Notes are per culture, so each culture is handled once however many images share it
+    done_cultures = set()
+    for entry in _iter_png_assets():
+        culture = entry.name.split('_')[0]
+        note_path = os.path.join(ASSETS_DIR, f"{culture}_note.txt")
+        if culture in done_cultures:
+            logger.info(f"{entry.name}: note saved to {note_path}")
+            continue
+        done_cultures.add(culture)
+        if _note_is_current(note_path):
+            logger.info(f"{entry.name}: reusing existing note {note_path}")
+            continue
+        note = generate_cultural_note(culture)
+        with open(note_path, 'w', encoding='utf-8') as f:
+            f.write(note)
+        logger.info(f"{entry.name}: note saved to {note_path}")
+
+def _read_note(note_path: str) -> Optional[str]:
+    """Return the stripped note text, or None if the note file doesn't exist."""
+    try:
+        with open(note_path, encoding='utf-8') as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+def _bundle_asset(entry: os.DirEntry, read_note: Callable[[str], Optional[str]]) -> str:
+    """Write the bundle JSON for one PNG entry and return its path."""
+    fname = entry.name
+    base = os.path.splitext(fname)[0]
+    culture = base.split('_')[0]
+    bundle: Dict[str, Any] = {"image": fname}
+    # Open directly instead of checking os.path.exists first: one syscall per file
+    try:
+        bundle["palette"] = json_utils.load(os.path.join(ASSETS_DIR, f"{base}_palette.json"))["palette"]
+    except FileNotFoundError:
+        pass
+    note = read_note(os.path.join(ASSETS_DIR, f"{culture}_note.txt"))
+    if note is not None:
+        bundle["note"] = note
+    bundle_path = os.path.join(ASSETS_DIR, f"{base}_bundle.json")
+    json_utils.dump(bundle, bundle_path)
+    return bundle_path
 
 def cli_bundle(args: argparse.Namespace) -> None:
     """Bundle image, palette, and note for each PNG in the assets directory."""
     logger.info("Bundling image, palette, and note for each PNG in assets/...")
-    for fname in os.listdir(ASSETS_DIR):
-        if fname.endswith('.png'):
-            base = os.path.splitext(fname)[0]
-            culture = base.split('_')[0]
-            img_path = os.path.join(ASSETS_DIR, fname)
-            palette_path = os.path.join(ASSETS_DIR, f"{base}_palette.json")
-            note_path = os.path.join(ASSETS_DIR, f"{culture}_note.txt")
-            bundle: Dict[str, Any] = {"image": fname}
-            if os.path.exists(palette_path):
-                with open(palette_path) as f:
-                    bundle["palette"] = json.load(f)["palette"]
-            if os.path.exists(note_path):
-                with open(note_path, encoding='utf-8') as f:
-                    bundle["note"] = f.read().strip()
-            bundle_path = os.path.join(ASSETS_DIR, f"{base}_bundle.json")
-            with open(bundle_path, 'w', encoding='utf-8') as f:
-                json.dump(bundle, f, indent=2)
+    # Each culture's note is shared by all its images, so read it once per run
+    read_note = functools.lru_cache(maxsize=None)(_read_note)
+    # The work is small-file I/O, so threads overlap it well; results are logged in listing order
+    with ThreadPoolExecutor(max_workers=BUNDLE_WORKERS) as pool:
+        for bundle_path in pool.map(lambda entry: _bundle_asset(entry, read_note), _iter_png_assets()):
             logger.info(f"Bundle saved to {bundle_path}")
 
 def cli_clip_score(args: argparse.Namespace) -> None:
     """Score all PNG images in the assets directory against a prompt using CLIP."""
     prompt: str = args.prompt
     logger.info(f"Scoring all PNG images in assets/ against prompt: '{prompt}'")
-    for fname in os.listdir(ASSETS_DIR):
-        if fname.endswith('.png'):
-            img_path = os.path.join(ASSETS_DIR, fname)
-            try:
-                score = score_image_with_prompt(img_path, prompt)
-                logger.info(f"{fname}: score = {score}")
-            except Exception as e:
-                logger.error(f"{fname}: error scoring image: {e}")
+    # Scoring runs in batches, so this command needs the whole listing up front
+    entries = list(_iter_png_assets())
+    scores = _clip_scores([e.path for e in entries], prompt)
+    for entry, score in zip(entries, scores):
+        if score is not None:
+            logger.info(f"{entry.name}: score = {score}")
 
 def cli_generate_kit(args: argparse.Namespace) -> None:
     """Generate a complete design kit for a culture using AI image analysis."""
+    asyncio.run(cli_generate_kit_async(args))
+
+async def cli_generate_kit_async(args: argparse.Namespace) -> None:
+    """
+    Async implementation of generate-kit: every Gemini call is awaited on one
+    AsyncGeminiClient, which bounds in-flight requests (GEMINI_MAX_CONCURRENCY).
+    """
+    from gemini_client import AsyncGeminiClient
+    from gemini_notes import generate_cultural_note_async
+    from export_formats import export_kit_formats
+    from ai_culture_generator import ai_culture_generator
     culture: str = args.culture
     logger.info(f"🎨 Generating AI-powered design kit for {culture} culture...")
-    kit_dir = os.path.join(ASSETS_DIR, f"{culture}_kit")
+    kit_dir = culture_kit_dir(culture)
     os.makedirs(kit_dir, exist_ok=True)
-    patterns = []
-    palettes = []
-    from gemini_client import gemini_client
-    try:
-        culture_details = gemini_client.generate_culture_details(culture)
-        clip_prompt = f"{culture.title()} {culture_details}"
-    except Exception as e:
-        logger.warning(f"Could not generate culture details for CLIP: {e}")
-        clip_prompt = f"{culture.title()} textile pattern, authentic cultural motifs"
-    pattern_metadata = []
-    for i in range(3):
-        logger.info(f"  Generating pattern {i+1}/3...")
-        try:
-            unique_filename = f"{culture}_pattern_{i+1}.png"
-            image_result = generate_pattern_image(culture, filename=unique_filename, sample_count=4, aspect_ratio="1:1")
-            if image_result:
-                image_paths = image_result if isinstance(image_result, list) else [image_result]
-                for idx, pattern_path in enumerate(image_paths):
-                    patterns.append(pattern_path)
-                    if not os.path.exists(pattern_path):
-                        logger.warning(f"File does not exist: {pattern_path}")
-                    try:
-                        palette_colors, palette_path = extract_palette(pattern_path)
-                        palettes.append({
-                            "colors": palette_colors,
-                            "source_image": os.path.basename(pattern_path),
-                            "note": f"Color palette extracted from {culture} pattern {idx+1}"
-                        })
-                    except Exception as e:
-                        logger.error(f"Error extracting palette: {e}")
-                    try:
-                        clip_score = score_image_with_prompt(pattern_path, clip_prompt)
-                        logger.info(f"CLIP score: {clip_score:.3f} for {os.path.basename(pattern_path)}")
-                    except Exception as e:
-                        logger.error(f"Error scoring with CLIP: {e}")
-                        clip_score = None
-                    pattern_metadata.append({
-                        "image": os.path.basename(pattern_path),
-                        "clip_score": clip_score,
-                        "clip_prompt": clip_prompt
-                    })
-        except Exception as e:
-            logger.error(f"Error generating pattern: {e}")
-    ai_metadata: Optional[Dict[str, Any]] = None
-    if patterns and os.path.exists(patterns[0]):
-        logger.info(f"  🤖 Analyzing generated patterns with AI...")
-        try:
-            ai_metadata = ai_culture_generator.generate_culture_metadata(culture, patterns[0])
-            logger.info(f"  ✅ AI analysis completed")
-        except Exception as e:
-            logger.warning(f"  ⚠️ AI analysis failed: {e}")
-    briefs = []
-    if ai_metadata and 'brief' in ai_metadata:
-        briefs.append(ai_metadata['brief'])
-        logger.info(f"  📋 Using AI-generated design brief")
-    else:
-        try:
-            brief = generate_cultural_note(culture)
-            briefs.append(brief)
-            logger.info(f"  📋 Using fallback cultural note")
-        except Exception as e:
-            logger.error(f"Error generating brief: {e}")
+    async with AsyncGeminiClient() as client:
+        # Fetched before the generations start, so their own details lookups hit the text cache
+        culture_details = await _with_retry(lambda: client.generate_culture_details(culture), "culture details")
+        if culture_details:
+            clip_prompt = f"{culture.title()} {culture_details}"
+        else:
+            logger.warning("Could not generate culture details for CLIP")
+            clip_prompt = f"{culture.title()} textile pattern, authentic cultural motifs"
+        logger.info(f"  Generating {PATTERN_VARIANTS} patterns concurrently...")
+        patterns, palettes, pattern_metadata = await _generate_pattern_assets(
+            client, culture, kit_dir, PATTERN_VARIANTS, clip_prompt,
+            regenerate=getattr(args, 'regenerate', False)
+        )
+        ai_metadata: Optional[Dict[str, Any]] = None
+        if patterns and os.path.exists(patterns[0]):
+            logger.info(f"  🤖 Analyzing generated patterns with AI...")
+            try:
+                ai_metadata = await ai_culture_generator.generate_culture_metadata_async(
+                    culture, patterns[0], client=client
+                )
+                logger.info(f"  ✅ AI analysis completed")
+            except Exception as e:
+                logger.warning(f"  ⚠️ AI analysis failed: {e}")
+        briefs = []
+        if ai_metadata and 'brief' in ai_metadata:
+            briefs.append(ai_metadata['brief'])
+            logger.info(f"  📋 Using AI-generated design brief")
+        else:
+            try:
+                brief = await generate_cultural_note_async(client, culture)
+                briefs.append(brief)
+                logger.info(f"  📋 Using fallback cultural note")
+            except Exception as e:
+                logger.error(f"Error generating brief: {e}")
     kit_metadata: Dict[str, Any] = {
         "culture": culture,
-        "generated_at": str(datetime.datetime.now()),
+        "generated_at": datetime.datetime.now(datetime.timezone.utc),
         "generated_by": "AI Image Analysis + Pattern Generation",
         "version": "2.0",
         "assets": {
@@ -187,17 +405,11 @@ def cli_generate_kit(args: argparse.Namespace) -> None:
         "compatible_platforms": ["Figma", "Canva", "Webflow", "Adobe Creative Suite"]
     }
     metadata_path = os.path.join(kit_dir, "kit_metadata.json")
-    with open(metadata_path, 'w') as f:
-        json.dump(kit_metadata, f, indent=2)
+    json_utils.dump(kit_metadata, metadata_path)
     if ai_metadata:
         ai_metadata_path = os.path.join(kit_dir, f"{culture}_ai_analysis.json")
-        with open(ai_metadata_path, 'w') as f:
-            json.dump(ai_metadata, f, indent=2)
+        json_utils.dump(ai_metadata, ai_metadata_path)
         logger.info(f"  💾 AI analysis saved to: {ai_metadata_path}")
-    for pattern_path in patterns:
-        if os.path.exists(pattern_path):
-            new_path = os.path.join(kit_dir, os.path.basename(pattern_path))
-            os.rename(pattern_path, new_path)
     logger.info("  Exporting in multiple formats...")
     exports = export_kit_formats(kit_dir, kit_metadata)
     logger.info(f"✅ AI-powered design kit generated in: {kit_dir}")
@@ -221,10 +433,10 @@ def cli_generate_culture_metadata(args: argparse.Namespace) -> None:
         logger.error(f"Image file not found: {image_path}")
         return
     logger.info(f"🤖 Generating AI-powered metadata for {culture} culture from image: {image_path}")
+    from ai_culture_generator import ai_culture_generator
     try:
         metadata = ai_culture_generator.generate_culture_metadata(culture, image_path)
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(metadata, f, indent=2, ensure_ascii=False)
+        json_utils.dump(metadata, output_path)
         logger.info(f"✅ Culture metadata generated and saved to: {output_path}")
         logger.info(f"📊 Generated data includes:")
         logger.info(f"   - {len(metadata.get('fonts', []))} fonts")
@@ -270,6 +482,7 @@ def main() -> None:
     # generate-kit
     kit_parser = subparsers.add_parser('generate-kit', help='Generate complete design kit for a culture')
     kit_parser.add_argument('--culture', required=True, help='Culture to generate kit for (e.g., yoruba, edo, maori, celtic, aztec, etc.)')
+    kit_parser.add_argument('--regenerate', action='store_true', help='Generate new patterns even if this kit already has them')
     kit_parser.set_defaults(func=cli_generate_kit)
 
     # generate-culture-metadata
@@ -278,7 +491,6 @@ def main() -> None:
     metadata_parser.add_argument('--image', required=True, help='Path to image file for AI analysis')
     metadata_parser.add_argument('--output', default=None, help='Output file path (default: culture_metadata.json)')
     metadata_parser.set_defaults(func=cli_generate_culture_metadata)
-    kit_parser.set_defaults(func=cli_generate_kit)
 
     args = parser.parse_args()
     if hasattr(args, 'func'):
@@ -3,7 +3,7 @@
 test_ai_culture.py - Test script for AI Culture Generator
 Demonstrates how AI can generate culture-specific design elements from image analysis.
 """
-import json
+import json_utils
 import os
 import logging
 from typing import Optional, Dict, Any
@@ -49,8 +49,7 @@ def test_culture_generation(culture_name: str, image_path: Optional[str] = None)
         logger.info(f"      - Cultural Context: {brief.get('cultural_context', 'N/A')[:80]}...")
         logger.info(f"      - Design Principles: {brief.get('design_principles', 'N/A')[:80]}...")
         filename = f"{culture_name}_ai_metadata.json"
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(metadata, f, indent=2, ensure_ascii=False)
+        json_utils.dump(metadata, filename)
         logger.info(f"\n💾 Metadata saved to: {filename}")
         return metadata
     except Exception as e:
@@ -1,22 +1,262 @@
 """
 web_api.py - Flask web API and UI for HeritageAI cultural design asset generation and download.
 """
-from flask import Flask, request, jsonify, send_file, render_template_string
+from flask import Flask, Response, request, jsonify, send_from_directory
+from flask.json.provider import DefaultJSONProvider
 import os
-import json
+import time
+import asyncio
+import gzip
+import shutil
+import tempfile
+import threading
+import uuid
 import zipfile
-import io
 import logging
-from datetime import datetime
-from main import cli_generate_kit, cli_clip_score, cli_generate_culture_metadata
-from export_formats import export_kit_formats
+import multiprocessing
+from main import ASSETS_DIR, culture_kit_dir, culture_slug, cli_generate_kit, cli_clip_score
 from ai_culture_generator import ai_culture_generator
+import json_utils
+from _cache import text_digest
 import argparse
-from typing import Any
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Deque, Dict, Iterator, List, Optional, Set, Tuple
+
+try:
+    from flask_compress import Compress
+except ImportError:
+    Compress = None
+
+class _FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by json_utils (orjson when installed) for jsonify and request.get_json."""
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        return json_utils.dumps(obj, indent=False).decode('utf-8')
+
+    def loads(self, s: Any, **kwargs: Any) -> Any:
+        return json_utils.loads(s)
+
+    def response(self, *args: Any, **kwargs: Any) -> Response:
+        # Hand the encoded bytes straight to the response instead of round-tripping through str
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(json_utils.dumps(obj, indent=False), mimetype=self.mimetype)
 
 app = Flask(__name__)
+app.json = _FastJSONProvider(app)
+# gzip dynamic text responses when Flask-Compress is installed; tiny envelopes aren't worth it,
+# and zip downloads are not text so they are never recompressed
+app.config['COMPRESS_MIN_SIZE'] = 256
+if Compress is not None:
+    Compress(app)
 logger = logging.getLogger(__name__)
 
+# Read size when copying kit files into a streamed zip
+ZIP_CHUNK_SIZE = 1 << 16
+# Kit generations run in worker processes (default one: generations are GPU/API-bound and
+# would only contend); finished jobs are kept this many seconds for status polling
+KIT_WORKERS = int(os.getenv('KIT_WORKERS', 1))
+JOB_RETENTION = 3600
+_job_pool: Optional[ProcessPoolExecutor] = None
+_jobs: Dict[str, Tuple[str, "Future[None]", float]] = {}
+_jobs_lock = threading.Lock()
+# Culture slugs (see main.culture_slug) whose kit this process has seen on disk, so downloads
+# skip the existence check
+_ready_kits: Set[str] = set()
+# Generated kits are reused for this long, and evicted least-recently-used beyond the size cap
+KIT_CACHE_TTL = int(os.getenv('KIT_CACHE_TTL', 24 * 3600))
+KIT_CACHE_MAX_BYTES = int(os.getenv('KIT_CACHE_MAX_BYTES', 5 * 1024 ** 3))
+KIT_MANIFEST = '.manifest.json'
+KIT_VERSION = '2.0'
+# Files up to this size are read ahead whole, at most ZIP_PREFETCH_FILES at a time
+ZIP_PREFETCH_FILES = 8
+ZIP_PREFETCH_MAX_BYTES = 1 << 20
+# Text formats worth deflating; PNG/JPEG assets are already entropy-coded and are stored as-is
+_COMPRESSIBLE_EXTENSIONS = {'.json', '.css', '.svg', '.txt', '.html', '.md'}
+
+class _ZipStreamBuffer:
+    """Write-only sink for zipfile that hands written bytes back in chunks instead of keeping the whole archive."""
+
+    def __init__(self) -> None:
+        self._chunks: List[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> Iterator[bytes]:
+        """Yield and forget everything written since the last drain."""
+        chunks, self._chunks = self._chunks, []
+        yield from chunks
+
+def _iter_kit_files(directory: str, prefix_len: int) -> Iterator[Tuple[os.DirEntry, str]]:
+    """
+    Recursively yield (entry, archive name) for every regular, non-hidden file under directory.
+    Uses the dirent type from os.scandir, so no per-entry stat is needed to tell files from
+    directories; archive names are sliced off the path instead of going through relpath.
+    """
+    with os.scandir(directory) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                yield from _iter_kit_files(entry.path, prefix_len)
+            elif entry.is_file(follow_symlinks=False) and not entry.name.startswith('.'):
+                yield entry, entry.path[prefix_len:]
+
+def _zip_info(entry: os.DirEntry, arc_name: str) -> zipfile.ZipInfo:
+    """Build the ZipInfo for a kit file from the entry's single stat() call."""
+    st = entry.stat(follow_symlinks=False)
+    zinfo = zipfile.ZipInfo(arc_name, time.localtime(st.st_mtime)[:6])
+    zinfo.external_attr = (st.st_mode & 0xFFFF) << 16
+    zinfo.file_size = st.st_size
+    if os.path.splitext(entry.name)[1].lower() in _COMPRESSIBLE_EXTENSIONS:
+        zinfo.compress_type = zipfile.ZIP_DEFLATED
+    return zinfo
+
+def _read_file(path: str) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
+def _stream_zip(kit_dir: str) -> Iterator[bytes]:
+    """
+    Yield a zip archive of kit_dir as it is built, so memory stays bounded rather than
+    holding the whole archive.
+    Small files are read ahead on a thread pool (up to ZIP_PREFETCH_FILES at once), keeping
+    several reads in flight while earlier entries are written; larger files are copied in chunks.
+    """
+    sink = _ZipStreamBuffer()
+    files = _iter_kit_files(kit_dir, len(os.path.join(kit_dir, '')))
+    window: Deque[Tuple[os.DirEntry, zipfile.ZipInfo, Optional["Future[bytes]"]]] = deque()
+    with ThreadPoolExecutor(max_workers=ZIP_PREFETCH_FILES) as pool:
+        def fill_window() -> None:
+            while len(window) < ZIP_PREFETCH_FILES:
+                item = next(files, None)
+                if item is None:
+                    return
+                entry, arc_name = item
+                zinfo = _zip_info(entry, arc_name)
+                prefetch = zinfo.file_size <= ZIP_PREFETCH_MAX_BYTES
+                window.append((entry, zinfo, pool.submit(_read_file, entry.path) if prefetch else None))
+
+        # The sink isn't seekable, so zipfile writes sizes in data descriptors after each entry
+        with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED, allowZip64=True) as zf:
+            fill_window()
+            while window:
+                entry, zinfo, pending = window.popleft()
+                fill_window()
+                with zf.open(zinfo, 'w') as dst:
+                    if pending is not None:
+                        dst.write(pending.result())
+                    else:
+                        with open(entry.path, 'rb') as src:
+                            for chunk in iter(lambda: src.read(ZIP_CHUNK_SIZE), b''):
+                                dst.write(chunk)
+                                yield from sink.drain()
+                yield from sink.drain()
+        yield from sink.drain()
+
+def _kit_zip_path(kit_dir: str) -> str:
+    """Where the pre-built download archive for kit_dir lives (next to it under assets/)."""
+    return f"{kit_dir}.zip"
+
+def _kit_generated_at(kit_dir: str) -> float:
+    """Generation time from the kit's manifest; kits made by the CLI fall back to the directory mtime."""
+    try:
+        return json_utils.load(os.path.join(kit_dir, KIT_MANIFEST))['timestamp']
+    except (OSError, ValueError, KeyError):
+        return os.stat(kit_dir).st_mtime
+
+def _build_kit_zip(kit_dir: str) -> str:
+    """Write the kit's download archive once, atomically, and return its path."""
+    zip_path = _kit_zip_path(kit_dir)
+    tmp_path = f"{zip_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            for chunk in _stream_zip(kit_dir):
+                f.write(chunk)
+        os.replace(tmp_path, zip_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+    return zip_path
+
+def _current_kit_zip(kit_dir: str) -> str:
+    """Return the kit's archive path, (re)building it if missing or older than the kit."""
+    zip_path = _kit_zip_path(kit_dir)
+    try:
+        if os.stat(zip_path).st_mtime >= _kit_generated_at(kit_dir):
+            return zip_path
+    except OSError:
+        pass
+    return _build_kit_zip(kit_dir)
+
+def _cached_kit(kit_dir: str) -> bool:
+    """True if kit_dir holds a complete kit generated less than KIT_CACHE_TTL seconds ago."""
+    try:
+        manifest = json_utils.load(os.path.join(kit_dir, KIT_MANIFEST))
+    except (OSError, ValueError):
+        return False
+    return manifest.get('version') == KIT_VERSION and time.time() - manifest.get('timestamp', 0) < KIT_CACHE_TTL
+
+def _write_manifest(kit_dir: str, culture: str) -> None:
+    """Mark kit_dir as a complete kit; the manifest's mtime doubles as the kit's last-used time."""
+    json_utils.dump({'culture': culture, 'timestamp': time.time(), 'version': KIT_VERSION}, os.path.join(kit_dir, KIT_MANIFEST))
+
+def _touch_kit(kit_dir: str) -> None:
+    """Record a use of kit_dir for LRU eviction."""
+    try:
+        os.utime(os.path.join(kit_dir, KIT_MANIFEST))
+    except OSError:
+        pass
+
+def _dir_size(directory: str) -> int:
+    """Total size in bytes of the regular files under directory."""
+    total = 0
+    with os.scandir(directory) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                total += _dir_size(entry.path)
+            elif entry.is_file(follow_symlinks=False):
+                total += entry.stat(follow_symlinks=False).st_size
+    return total
+
+def _evict_kits(keep: Set[str]) -> None:
+    """
+    Delete least recently used web-generated kits (and their archives) until they fit in
+    KIT_CACHE_MAX_BYTES. Only directories with a manifest are candidates, so kits made by the
+    CLI (and kits still being generated for the first time) are never touched; kit
+    directories in keep are skipped as well.
+    """
+    kits = []
+    with os.scandir(ASSETS_DIR) as it:
+        for entry in it:
+            if entry.name.endswith('_kit') and entry.is_dir(follow_symlinks=False):
+                try:
+                    last_used = os.stat(os.path.join(entry.path, KIT_MANIFEST)).st_mtime
+                except OSError:
+                    continue
+                try:
+                    zip_size = os.stat(_kit_zip_path(entry.path)).st_size
+                except OSError:
+                    zip_size = 0
+                kits.append((last_used, _dir_size(entry.path) + zip_size, entry.path))
+    total = sum(size for _, size, _ in kits)
+    for _, size, path in sorted(kits):
+        if total <= KIT_CACHE_MAX_BYTES:
+            break
+        if path in keep:
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+        try:
+            os.unlink(_kit_zip_path(path))
+        except OSError:
+            pass
+        total -= size
+        logger.info(f"Evicted cached kit {os.path.basename(path)} ({size} bytes)")
+
 # Simple HTML template for the web interface
 HTML_TEMPLATE = """
 <!DOCTYPE html>
@@ -67,22 +307,34 @@ HTML_TEMPLATE = """
     </div>
     
     <script>
-        function generateKit(culture) {
-            document.getElementById(culture + '-status').style.display = 'block';
+        // Generation runs as a background job; poll it, then start the download
+        function requestKit(culture, statusId) {
+            const status = document.getElementById(statusId);
+            status.style.display = 'block';
+            const finish = data => {
+                status.style.display = 'none';
+                if (data.success && data.status === 'done') {
+                    window.location.href = '/api/download-kit/' + encodeURIComponent(data.culture);
+                } else {
+                    alert('Error: ' + data.error);
+                }
+            };
+            const poll = jobId => {
+                fetch('/api/generate-kit/' + jobId)
+                .then(response => response.json())
+                .then(data => data.success && data.status === 'pending' ? setTimeout(() => poll(jobId), 2000) : finish(data));
+            };
             fetch('/api/generate-kit', {
                 method: 'POST',
                 headers: {'Content-Type': 'application/json'},
                 body: JSON.stringify({culture: culture})
             })
             .then(response => response.json())
-            .then(data => {
-                if (data.success) {
-                    window.location.href = '/api/download-kit/' + culture;
-                } else {
-                    alert('Error: ' + data.error);
-                }
-                document.getElementById(culture + '-status').style.display = 'none';
-            });
+            .then(data => data.success && data.status === 'pending' ? poll(data.job_id) : finish(data));
+        }
+        
+        function generateKit(culture) {
+            requestKit(culture, culture + '-status');
         }
         
         function generateCustomKit() {
@@ -91,137 +343,261 @@ HTML_TEMPLATE = """
                 alert('Please enter a culture name');
                 return;
             }
-            
-            document.getElementById('custom-status').style.display = 'block';
-            fetch('/api/generate-kit', {
-                method: 'POST',
-                headers: {'Content-Type': 'application/json'},
-                body: JSON.stringify({culture: culture})
-            })
-            .then(response => response.json())
-            .then(data => {
-                if (data.success) {
-                    window.location.href = '/api/download-kit/' + culture;
-                } else {
-                    alert('Error: ' + data.error);
-                }
-                document.getElementById('custom-status').style.display = 'none';
-            });
+            requestKit(culture, 'custom-status');
         }
     </script>
 </body>
 </html>
 """
 
+# The page has no per-request variables: render it once and let browsers revalidate by ETag
+INDEX_MAX_AGE = 3600
+_INDEX_HTML = app.jinja_env.from_string(HTML_TEMPLATE).render().encode('utf-8')
+_INDEX_ETAG = text_digest(_INDEX_HTML.decode('utf-8'))
+
+# Level used for bodies gzipped once at import
+STATIC_GZIP_LEVEL = 6
+_INDEX_GZ = gzip.compress(_INDEX_HTML, STATIC_GZIP_LEVEL, mtime=0)
+
+def _static_response(body: bytes, body_gz: bytes, mimetype: str, etag: str, max_age: int) -> Response:
+    """
+    Wrap a precomputed body in a cacheable response, answering 304 when the client's ETag matches.
+    The pre-gzipped body is sent to clients that accept gzip; each encoding has its own ETag.
+    """
+    # Built per request: make_conditional mutates the response it is given
+    if request.accept_encodings['gzip']:
+        response = Response(body_gz, mimetype=mimetype)
+        response.headers['Content-Encoding'] = 'gzip'
+        etag = f"{etag}-gz"
+    else:
+        response = Response(body, mimetype=mimetype)
+    response.vary.add('Accept-Encoding')
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    return response.make_conditional(request)
+
 @app.route('/')
 def index() -> Any:
-    """Render the main web UI for HeritageAI."""
-    return render_template_string(HTML_TEMPLATE)
+    """Serve the main web UI for HeritageAI (304 when the browser's copy is current)."""
+    return _static_response(_INDEX_HTML, _INDEX_GZ, 'text/html', _INDEX_ETAG, INDEX_MAX_AGE)
+
+def _generate_kit_job(culture: str) -> None:
+    """Background job: generate the kit, mark it complete and pre-build its archive."""
+    kit_dir = culture_kit_dir(culture)
+    # Jobs only run when the kit isn't current, so an existing manifest means it expired:
+    # generate fresh patterns instead of reusing the ones recorded for the old kit
+    regenerate = os.path.exists(os.path.join(kit_dir, KIT_MANIFEST))
+    cli_generate_kit(argparse.Namespace(culture=culture, regenerate=regenerate))
+    _write_manifest(kit_dir, culture)
+    # Zip once here so every download is a plain file send
+    _build_kit_zip(kit_dir)
+    logger.info(f"Kit generated for culture: {culture}")
+
+def _get_job_pool() -> ProcessPoolExecutor:
+    """Create the generation worker pool on first use (not at import, so servers can fork first)."""
+    global _job_pool
+    if _job_pool is None:
+        # Spawned, not forked: the server process is multi-threaded (locks may be held, SQLite
+        # connections open) and CUDA can't be initialised in a forked child
+        _job_pool = ProcessPoolExecutor(max_workers=KIT_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+    return _job_pool
+
+def _pending_job(slug: str) -> Optional[str]:
+    """Id of the unfinished job writing the kit for culture slug, if any; call with _jobs_lock held."""
+    for job_id, (job_culture, future, _) in _jobs.items():
+        if culture_slug(job_culture) == slug and not future.done():
+            return job_id
+    return None
+
+def _submit_kit_job(culture: str) -> str:
+    """Queue a kit generation, reusing the pending job if one already exists for this culture's kit."""
+    global _job_pool
+    with _jobs_lock:
+        now = time.time()
+        for job_id, (_, future, submitted_at) in list(_jobs.items()):
+            if future.done() and now - submitted_at > JOB_RETENTION:
+                del _jobs[job_id]
+        pending = _pending_job(culture_slug(culture))
+        if pending is not None:
+            return pending
+        try:
+            future = _get_job_pool().submit(_generate_kit_job, culture)
+        except BrokenProcessPool:
+            # A worker died (e.g. out of memory); start a fresh pool for new jobs
+            _job_pool = None
+            future = _get_job_pool().submit(_generate_kit_job, culture)
+        job_id = uuid.uuid4().hex
+        _jobs[job_id] = (culture, future, now)
+    # Registered outside the lock: the callback takes it, and runs immediately if the job already finished
+    future.add_done_callback(lambda _: _evict_after_job(culture))
+    return job_id
+
+def _evict_after_job(culture: str) -> None:
+    """Enforce the kit cache cap once a job ends, sparing its kit and every kit a pending job is writing."""
+    with _jobs_lock:
+        keep = {culture_kit_dir(job_culture) for job_culture, future, _ in _jobs.values() if not future.done()}
+    keep.add(culture_kit_dir(culture))
+    try:
+        _evict_kits(keep)
+    except OSError as e:
+        logger.warning(f"Kit eviction failed: {e}")
 
 @app.route('/api/generate-kit', methods=['POST'])
 def api_generate_kit() -> Any:
-    """API endpoint to generate a design kit for a given culture."""
+    """API endpoint to start generating a design kit for a given culture; poll the returned job_id for completion."""
     try:
         data = request.get_json()
         culture = data.get('culture')
         if not culture:
             logger.error("Culture is required for kit generation.")
             return jsonify({'success': False, 'error': 'Culture is required'})
-        class MockArgs:
-            def __init__(self, culture):
-                self.culture = culture
-        args = MockArgs(culture)
-        cli_generate_kit(args)
-        logger.info(f"Kit generated for culture: {culture}")
-        return jsonify({'success': True, 'culture': culture})
+        slug = culture_slug(culture)
+        if slug is None:
+            logger.error(f"Invalid culture name for kit generation: {culture!r}")
+            return jsonify({'success': False, 'error': 'Invalid culture name'})
+        kit_dir = culture_kit_dir(culture)
+        if _cached_kit(kit_dir):
+            logger.info(f"Reusing cached kit for culture: {culture}")
+            _touch_kit(kit_dir)
+            _ready_kits.add(slug)
+            return jsonify({'success': True, 'culture': culture, 'cached': True, 'status': 'done'})
+        job_id = _submit_kit_job(culture)
+        logger.info(f"Kit generation queued for culture: {culture} (job {job_id})")
+        return jsonify({'success': True, 'culture': culture, 'job_id': job_id, 'status': 'pending'})
     except Exception as e:
         logger.error(f"Error generating kit: {e}")
         return jsonify({'success': False, 'error': str(e)})
 
+@app.route('/api/generate-kit/<job_id>')
+def api_generate_kit_status(job_id: str) -> Any:
+    """API endpoint to check a kit generation job: pending, done or error."""
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Unknown job'}), 404
+    culture, future, _ = job
+    if not future.done():
+        return jsonify({'success': True, 'culture': culture, 'job_id': job_id, 'status': 'pending'})
+    error = future.exception()
+    if error is not None:
+        logger.error(f"Error generating kit: {error}")
+        return jsonify({'success': False, 'culture': culture, 'job_id': job_id, 'status': 'error', 'error': str(error)})
+    _ready_kits.add(culture_slug(culture))
+    return jsonify({'success': True, 'culture': culture, 'job_id': job_id, 'status': 'done'})
+
+def _send_kit_zip(zip_path: str, slug: str) -> Any:
+    """Send a kit archive as a download."""
+    # A file send lets the server use sendfile(2); conditional adds ETag/Last-Modified for 304s
+    return send_from_directory(
+        os.path.dirname(zip_path),
+        os.path.basename(zip_path),
+        mimetype='application/zip',
+        as_attachment=True,
+        download_name=f'{slug}_design_kit.zip',
+        conditional=True
+    )
+
 @app.route('/api/download-kit/<culture>')
 def download_kit(culture: str) -> Any:
     """API endpoint to download a generated design kit as a zip file."""
     try:
-        kit_dir = os.path.join('assets', f'{culture}_kit')
-        if not os.path.exists(kit_dir):
+        slug = culture_slug(culture)
+        if slug is None:
+            logger.error(f"Invalid culture name for kit download: {culture!r}")
+            return jsonify({'error': 'Invalid culture name'})
+        kit_dir = culture_kit_dir(culture)
+        if slug not in _ready_kits and not os.path.isdir(kit_dir):
             logger.error(f"Kit not found for culture: {culture}")
             return jsonify({'error': 'Kit not found'})
-        memory_file = io.BytesIO()
-        with zipfile.ZipFile(memory_file, 'w') as zf:
-            for root, dirs, files in os.walk(kit_dir):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    arc_name = os.path.relpath(file_path, kit_dir)
-                    zf.write(file_path, arc_name)
-        memory_file.seek(0)
-        logger.info(f"Kit zipped and sent for culture: {culture}")
-        return send_file(
-            memory_file,
-            mimetype='application/zip',
-            as_attachment=True,
-            download_name=f'{culture}_design_kit.zip'
-        )
+        with _jobs_lock:
+            regenerating = _pending_job(slug) is not None
+        if regenerating:
+            # The directory is being rewritten: only the archive built before the job is consistent
+            zip_path = _kit_zip_path(kit_dir)
+            if not os.path.exists(zip_path):
+                logger.error(f"Kit still being generated for culture: {culture}")
+                return jsonify({'error': 'Kit is still being generated'})
+            logger.info(f"Kit for {culture} is being regenerated; sending the previous archive")
+            return _send_kit_zip(zip_path, slug)
+        _touch_kit(kit_dir)
+        try:
+            zip_path = _current_kit_zip(kit_dir)
+        except FileNotFoundError:
+            # Evicted since it was marked ready
+            _ready_kits.discard(slug)
+            logger.error(f"Kit not found for culture: {culture}")
+            return jsonify({'error': 'Kit not found'})
+        _ready_kits.add(slug)
+        logger.info(f"Sending zipped kit for culture: {culture}")
+        return _send_kit_zip(zip_path, slug)
     except Exception as e:
         logger.error(f"Error downloading kit: {e}")
         return jsonify({'error': str(e)})
 
+# Example cultures listed by /api/cultures; the payload is static, so it is encoded once
+DEFAULT_CULTURES = [
+    {
+        'id': 'yoruba',
+        'name': 'Yoruba',
+        'description': 'Traditional Nigerian patterns and colors',
+        'region': 'West Africa'
+    },
+    {
+        'id': 'edo',
+        'name': 'Edo',
+        'description': 'Benin Kingdom artistic traditions',
+        'region': 'West Africa'
+    },
+    {
+        'id': 'maori',
+        'name': 'Maori',
+        'description': 'Indigenous New Zealand designs',
+        'region': 'Oceania'
+    }
+]
+POPULAR_CULTURES = [
+    {
+        'id': 'celtic',
+        'name': 'Celtic',
+        'description': 'Ancient European knotwork and spirals',
+        'region': 'Europe'
+    },
+    {
+        'id': 'aztec',
+        'name': 'Aztec',
+        'description': 'Mesoamerican geometric and symbolic designs',
+        'region': 'Americas'
+    },
+    {
+        'id': 'japanese',
+        'name': 'Japanese',
+        'description': 'Traditional Japanese art and patterns',
+        'region': 'Asia'
+    },
+    {
+        'id': 'persian',
+        'name': 'Persian',
+        'description': 'Ancient Persian ornamental designs',
+        'region': 'Middle East'
+    }
+]
+_CULTURES_JSON = json_utils.dumps({
+    'default': DEFAULT_CULTURES,
+    'popular': POPULAR_CULTURES,
+    'note': 'You can use any culture name - these are just examples!'
+}, indent=False)
+_CULTURES_GZ = gzip.compress(_CULTURES_JSON, STATIC_GZIP_LEVEL, mtime=0)
+_CULTURES_ETAG = text_digest(_CULTURES_JSON.decode('utf-8'))
+CULTURES_MAX_AGE = 86400
+
 @app.route('/api/cultures')
 def get_cultures() -> Any:
     """API endpoint to get a list of example and popular cultures."""
-    default_cultures = [
-        {
-            'id': 'yoruba',
-            'name': 'Yoruba',
-            'description': 'Traditional Nigerian patterns and colors',
-            'region': 'West Africa'
-        },
-        {
-            'id': 'edo',
-            'name': 'Edo',
-            'description': 'Benin Kingdom artistic traditions',
-            'region': 'West Africa'
-        },
-        {
-            'id': 'maori',
-            'name': 'Maori',
-            'description': 'Indigenous New Zealand designs',
-            'region': 'Oceania'
-        }
-    ]
-    popular_cultures = [
-        {
-            'id': 'celtic',
-            'name': 'Celtic',
-            'description': 'Ancient European knotwork and spirals',
-            'region': 'Europe'
-        },
-        {
-            'id': 'aztec',
-            'name': 'Aztec',
-            'description': 'Mesoamerican geometric and symbolic designs',
-            'region': 'Americas'
-        },
-        {
-            'id': 'japanese',
-            'name': 'Japanese',
-            'description': 'Traditional Japanese art and patterns',
-            'region': 'Asia'
-        },
-        {
-            'id': 'persian',
-            'name': 'Persian',
-            'description': 'Ancient Persian ornamental designs',
-            'region': 'Middle East'
-        }
-    ]
-    return jsonify({
-        'default': default_cultures,
-        'popular': popular_cultures,
-        'note': 'You can use any culture name - these are just examples!'
-    })
+    return _static_response(_CULTURES_JSON, _CULTURES_GZ, 'application/json', _CULTURES_ETAG, CULTURES_MAX_AGE)
 
 @app.route('/api/clip-score', methods=['POST'])
-def api_clip_score() -> Any:
+async def api_clip_score() -> Any:
     """API endpoint to score images in assets/ against a prompt using CLIP."""
     try:
         data = request.get_json()
@@ -229,11 +605,8 @@ def api_clip_score() -> Any:
         if not prompt:
             logger.error("Prompt required for CLIP scoring.")
             return jsonify({'error': 'Prompt required'})
-        class MockArgs:
-            def __init__(self, prompt):
-                self.prompt = prompt
-        args = MockArgs(prompt)
-        cli_clip_score(args)
+        # CLIP inference is CPU/GPU-bound and synchronous; keep it off the event loop
+        await asyncio.to_thread(cli_clip_score, argparse.Namespace(prompt=prompt))
         logger.info(f"CLIP scoring completed for prompt: {prompt}")
         return jsonify({'success': True})
     except Exception as e:
@@ -241,7 +614,7 @@ def api_clip_score() -> Any:
         return jsonify({'error': str(e)})
 
 @app.route('/api/generate-culture-metadata', methods=['POST'])
-def api_generate_culture_metadata() -> Any:
+async def api_generate_culture_metadata() -> Any:
     """API endpoint to generate AI-powered culture metadata from an uploaded image."""
     try:
         if 'image' not in request.files:
@@ -255,24 +628,27 @@ def api_generate_culture_metadata() -> Any:
         if image_file.filename == '':
             logger.error("No image selected for culture metadata generation.")
             return jsonify({'success': False, 'error': 'No image selected'})
-        import tempfile
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as tmp_file:
-            image_file.save(tmp_file.name)
-            image_path = tmp_file.name
-        try:
-            metadata = ai_culture_generator.generate_culture_metadata(culture, image_path)
-            logger.info(f"Culture metadata generated for {culture}")
-            return jsonify({
-                'success': True, 
-                'culture': culture,
-                'metadata': metadata
-            })
-        finally:
-            if os.path.exists(image_path):
-                os.unlink(image_path)
+        # The analysis pipeline opens the image by path, so the upload still needs a file. It goes
+        # in a private directory, removed with everything in it (including the palette sidecar
+        # written next to the image) when the block exits, even on error
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            image_path = os.path.join(tmp_dir, 'upload.png')
+            with open(image_path, 'wb') as f:
+                shutil.copyfileobj(image_file.stream, f, ZIP_CHUNK_SIZE)
+            # No client passed: the analysis runs on the process-wide sync client in a worker thread,
+            # reusing its connection pool and caches (each async view gets a fresh event loop, so an
+            # async client would have to be rebuilt per request)
+            metadata = await ai_culture_generator.generate_culture_metadata_async(culture, image_path)
+        logger.info(f"Culture metadata generated for {culture}")
+        return jsonify({
+            'success': True, 
+            'culture': culture,
+            'metadata': metadata
+        })
     except Exception as e:
         logger.error(f"Error generating culture metadata: {e}")
         return jsonify({'success': False, 'error': str(e)})
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000) 
\ No newline at end of file
+    # Development server only; production runs under gunicorn (see Procfile)
+    app.run(debug=os.getenv('FLASK_DEBUG', '').lower() in ('1', 'true'), host='0.0.0.0', port=5000)